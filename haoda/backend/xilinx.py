@@ -1,18 +1,26 @@
 import argparse
 import collections
+import concurrent.futures
 import contextlib
-import glob
+import fnmatch
+import functools
+import hashlib
 import logging
+import multiprocessing
 import os
 import shlex
+import shutil
+import stat
+import string
 import subprocess
 import tarfile
 import tempfile
+import types
 import xml.etree.ElementTree as ET
 import xml.sax.saxutils
 import zipfile
-from typing import (BinaryIO, Dict, Iterable, Iterator, List, Mapping, Optional,
-                    TextIO, Tuple, Union)
+from typing import (Any, BinaryIO, Callable, Dict, Iterable, Iterator, List,
+                    Mapping, NoReturn, Optional, TextIO, Tuple, Union)
 
 import absl.flags
 
@@ -22,6 +30,41 @@ from haoda.backend.common import Arg, Cat
 _logger = logging.getLogger().getChild(__name__)
 
 
+@contextlib.contextmanager
+def _tcl_file(commands: str, cwd: str, kwargs: Dict[str, Any]) -> Iterator[str]:
+  """Make Tcl commands readable by a child process.
+
+  If available, the commands are kept in an anonymous in-memory file which is
+  passed to the child process via `pass_fds`; otherwise they are written to
+  `commands.tcl` under cwd.
+
+  Args:
+    commands: A string of Tcl commands.
+    cwd: Working directory of the child process.
+    kwargs: Keyword arguments to subprocess.Popen. This will be updated if
+        necessary.
+
+  Yields:
+    Path of the Tcl file, valid in the child process. The child process must be
+    started before leaving the context.
+  """
+  memfd_create = getattr(os, 'memfd_create', None)
+  if memfd_create is None:
+    tcl_file_name = os.path.join(cwd, 'commands.tcl')
+    with open(tcl_file_name, mode='w') as tcl_file:
+      tcl_file.write(commands)
+    yield tcl_file_name
+    return
+  fd = memfd_create('commands.tcl')
+  try:
+    with open(fd, mode='w', closefd=False) as tcl_file:
+      tcl_file.write(commands)
+    kwargs['pass_fds'] = (*kwargs.get('pass_fds', ()), fd)
+    yield f'/proc/self/fd/{fd}'
+  finally:
+    os.close(fd)
+
+
 class Vivado(subprocess.Popen):
   """Call vivado with the given Tcl commands and arguments.
 
@@ -35,16 +78,14 @@ class Vivado(subprocess.Popen):
 
   def __init__(self, commands: str, *args: Iterable[str]):
     self.cwd = tempfile.TemporaryDirectory(prefix='vivado-')
-    with open(os.path.join(self.cwd.name, 'commands.tcl'),
-              mode='w+') as tcl_file:
-      tcl_file.write(commands)
-    cmd_args = [
-        'vivado', '-mode', 'batch', '-source', tcl_file.name, '-nojournal',
-        '-tclargs', *args
-    ]
     kwargs = {'stdout': subprocess.PIPE, 'stderr': subprocess.PIPE}
-    cmd_args = get_cmd_args(cmd_args, ['XILINX_VIVADO'], kwargs)
-    super().__init__(cmd_args, cwd=self.cwd.name, **kwargs)  # type: ignore
+    with _tcl_file(commands, self.cwd.name, kwargs) as tcl_file_name:
+      cmd_args = [
+          'vivado', '-mode', 'batch', '-source', tcl_file_name, '-nojournal',
+          '-tclargs', *args
+      ]
+      cmd_args = get_cmd_args(cmd_args, ['XILINX_VIVADO'], kwargs)
+      super().__init__(cmd_args, cwd=self.cwd.name, **kwargs)  # type: ignore
 
   def __exit__(self, *args) -> None:
     super().__exit__(*args)
@@ -68,15 +109,15 @@ class VivadoHls(subprocess.Popen):
     else:
       self.cwd = tempfile.TemporaryDirectory(prefix=f'{hls}-')
       cwd = self.cwd.name
-    with open(os.path.join(cwd, 'commands.tcl'), mode='w+') as tcl_file:
-      tcl_file.write(commands)
-    cmd_args = [hls, '-f', tcl_file.name]
     kwargs = {'stdout': subprocess.PIPE, 'stderr': subprocess.PIPE}
-    if hls == 'vitis_hls':
-      cmd_args = get_cmd_args(cmd_args, ['XILINX_HLS', 'XILINX_VITIS'], kwargs)
-    elif hls == 'vivado_hls':
-      cmd_args = get_cmd_args(cmd_args, ['XILINX_VIVADO'], kwargs)
-    super().__init__(cmd_args, cwd=cwd, **kwargs)  # type: ignore
+    with _tcl_file(commands, cwd, kwargs) as tcl_file_name:
+      cmd_args = [hls, '-f', tcl_file_name]
+      if hls == 'vitis_hls':
+        cmd_args = get_cmd_args(cmd_args, ['XILINX_HLS', 'XILINX_VITIS'],
+                                kwargs)
+      elif hls == 'vivado_hls':
+        cmd_args = get_cmd_args(cmd_args, ['XILINX_VIVADO'], kwargs)
+      super().__init__(cmd_args, cwd=cwd, **kwargs)  # type: ignore
 
   def __exit__(self, *args) -> None:
     super().__exit__(*args)
@@ -85,12 +126,13 @@ class VivadoHls(subprocess.Popen):
 
 
 PACKAGEXO_COMMANDS = r'''
+set_param general.maxThreads {max_threads}
 set tmp_ip_dir "{tmpdir}/tmp_ip_dir"
 set tmp_project "{tmpdir}/tmp_project"
 
 create_project -force kernel_pack ${{tmp_project}}{part_num}
-add_files -norecurse [glob {hdl_dir}/*.v {hdl_dir}/*/*.v {hdl_dir}/*.dat]
-foreach tcl_file [glob -nocomplain {hdl_dir}/*.tcl {hdl_dir}/*/*.tcl] {{
+add_files -norecurse [list {hdl_files}]
+foreach tcl_file [list {tcl_files}] {{
   source ${{tcl_file}}
 }}
 set_property top {top_name} [current_fileset]
@@ -123,11 +165,174 @@ ipx::associate_bus_interfaces -busif {} -clock ap_clk [ipx::current_core]
 
 BUS_PARAM = 'set_property value {2} [ipx::add_bus_parameter {1} [ipx::get_bus_interfaces {0}]]\n'
 
+# maximum of general.maxThreads supported by Vivado
+VIVADO_MAX_THREADS = 8
+
 S_AXI_NAME = 's_axi_control'
 M_AXI_PREFIX = 'm_axi_'
+HDL_SUFFIXES = ('.v', '.dat', '.tcl')
+
+
+def _scan_hdl_files(hdl_dir: str, depth: int = 1) -> Iterator[str]:
+  """Yield HDL_SUFFIXES files under hdl_dir, relative to hdl_dir.
+
+  Only files in hdl_dir and its immediate subdirectories (by default) are
+  yielded. Uses os.scandir so that no extra stat is needed per entry.
+  """
+  with os.scandir(hdl_dir) as entries:
+    for entry in entries:
+      if entry.is_dir():
+        if depth > 0:
+          for filename in _scan_hdl_files(entry.path, depth - 1):
+            yield os.path.join(entry.name, filename)
+      elif entry.is_file() and entry.name.endswith(HDL_SUFFIXES):
+        yield entry.name
+
+
+def _tcl_list(items: Iterable[str]) -> str:
+  """Format items as words of a literal Tcl list."""
+  return ' '.join(map('{{{}}}'.format, items))
+
+
+BUILD_CACHE_ENV = 'HAODA_BUILD_CACHE'
+
+
+def _get_build_cache_dir(kind: str) -> Optional[str]:
+  """Get the build cache directory for kind, or None if caching is disabled.
+
+  The build cache is enabled by setting $HAODA_BUILD_CACHE to 1, and is
+  located at $XDG_CACHE_HOME/haoda (default to ~/.cache/haoda).
+  """
+  if os.environ.get(BUILD_CACHE_ENV) != '1':
+    return None
+  cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+      os.path.expanduser('~'), '.cache')
+  cache_dir = os.path.join(cache_home, 'haoda', kind)
+  os.makedirs(cache_dir, exist_ok=True)
+  return cache_dir
+
+
+@functools.lru_cache(maxsize=None)
+def _get_tool_version(tool: str, env_names: Tuple[str, ...]) -> bytes:
+  """Get the version output of tool; failures raise and thus are not cached."""
+  kwargs = {'stdout': subprocess.PIPE, 'stderr': subprocess.DEVNULL}
+  cmd_args = get_cmd_args([tool, '-version'], env_names, kwargs)
+  return subprocess.run(cmd_args, check=True, **kwargs).stdout
+
+
+def _get_build_cache_file(
+    kind: str,
+    tool: str,
+    env_names: Tuple[str, ...],
+    suffix: str,
+    *inputs: Union[str, bytes],
+) -> Optional[str]:
+  """Get the build cache file for the given tool and inputs.
+
+  Args:
+    kind: Kind of the build cache, see _get_build_cache_dir.
+    tool: Name of the tool whose version is hashed together with inputs.
+    env_names: Environment variable names to find the tool, see get_cmd_args.
+    suffix: Suffix of the cache file name.
+    *inputs: Build inputs, see _hash_build_inputs.
+
+  Returns:
+    Path to the cache file, which may not exist yet, or None if caching is
+    disabled or the tool version cannot be determined.
+  """
+  cache_dir = _get_build_cache_dir(kind)
+  if cache_dir is None:
+    return None
+  try:
+    version = _get_tool_version(tool, env_names)
+  except (OSError, subprocess.CalledProcessError) as e:
+    _logger.warning('not using build cache; failed to get %s version: %s',
+                    tool, e)
+    return None
+  return os.path.join(cache_dir, _hash_build_inputs(version, *inputs) + suffix)
+
+
+def _hash_build_inputs(*inputs: Union[str, bytes]) -> str:
+  """Hash build inputs.
+
+  Args:
+    *inputs: Each bytes is hashed as-is; each str is treated as a file name and
+        the basename and content of the file are hashed.
+
+  Returns:
+    Hex digest of the inputs.
+  """
+  digest = hashlib.sha256()
+  for item in inputs:
+    if isinstance(item, str):
+      digest.update(os.path.basename(item).encode() + b'\0')
+      with open(item, 'rb') as fileobj:
+        item = fileobj.read()
+    digest.update(b'%d:' % len(item))
+    digest.update(item)
+  return digest.hexdigest()
+
+
+def _store_build_cache(src: str, cache_file: str) -> None:
+  """Atomically copy src to cache_file."""
+  fd, tmp_name = tempfile.mkstemp(dir=os.path.dirname(cache_file))
+  os.close(fd)
+  try:
+    shutil.copyfile(src, tmp_name)
+    os.replace(tmp_name, cache_file)
+  except OSError as e:
+    _logger.warning('failed to update build cache %s: %s', cache_file, e)
+    os.remove(tmp_name)
+
 
+class _CachedPopen(subprocess.Popen):
+  """A subprocess.Popen mixin for tools whose result may be cached.
 
-class PackageXo(Vivado):
+  If the result is cached, the subclass calls _init_cache_hit instead of
+  subprocess.Popen.__init__, and no process is launched. The object then
+  behaves as a tool process that has completed successfully with empty output,
+  so wait, poll, communicate and the context manager work as usual for
+  callers.
+  """
+  cache_hit = False
+
+  def _init_cache_hit(self, args: Union[List[str], str]) -> None:
+    self.cache_hit = True
+    self.args = args
+    self.stdin = self.stdout = self.stderr = None
+    self.pid = None
+    self.returncode = 0
+
+  def poll(self) -> Optional[int]:
+    if self.cache_hit:
+      return self.returncode
+    return super().poll()
+
+  def wait(self, timeout: Optional[float] = None) -> int:
+    if self.cache_hit:
+      return self.returncode
+    return super().wait(timeout)
+
+  # pylint: disable=redefined-builtin
+  def communicate(self, input=None, timeout=None):
+    if self.cache_hit:
+      return b'', b''
+    return super().communicate(input, timeout)
+
+  def send_signal(self, sig: int) -> None:
+    if not self.cache_hit:
+      super().send_signal(sig)
+
+  def __exit__(self, *args) -> None:
+    if not self.cache_hit:
+      super().__exit__(*args)
+
+  def __del__(self, *args, **kwargs) -> None:
+    if not self.cache_hit:
+      super().__del__(*args, **kwargs)
+
+
+class PackageXo(_CachedPopen, Vivado):
   """Packages the given files into a Xilinx hardware object.
 
   This is a subclass of subprocess.Popen. A temporary directory will be created
@@ -143,6 +348,11 @@ class PackageXo(Vivado):
     iface_names: Other interface names, default to (S_AXI_NAME,).
     cpp_kernels: File names of C++ kernels.
     part_num: Part number of the target device.
+    max_threads: Maximum number of threads Vivado may use, default to the
+        number of processors up to VIVADO_MAX_THREADS.
+
+  If $HAODA_BUILD_CACHE is 1, the generated xo file is cached by the hash of
+  the inputs, and Vivado is not launched if a cached xo file is found.
   """
 
   def __init__(
@@ -155,12 +365,28 @@ class PackageXo(Vivado):
       iface_names: Iterable[str] = (S_AXI_NAME,),
       cpp_kernels: Iterable[str] = (),
       part_num: str = '',
+      max_threads: Optional[int] = None,
   ):
+    if max_threads is None:
+      max_threads = min(os.cpu_count() or 1, VIVADO_MAX_THREADS)
     self.tmpdir = tempfile.TemporaryDirectory(prefix='package-xo-')
+    self.xo_file = xo_file
+    self.cache_file: Optional[str] = None
+    self.cache_hit = False
+    cpp_kernels = tuple(cpp_kernels)
+    # *.v and */*.v, *.dat, *.tcl and */*.tcl
+    hdl_files = []
+    tcl_files = []
+    for filename in sorted(_scan_hdl_files(hdl_dir)):
+      if filename.endswith('.tcl'):
+        tcl_files.append(filename)
+      elif filename.endswith('.v') or os.sep not in filename:
+        hdl_files.append(filename)
+    _logger.info('packing %d HDL files and %d Tcl files from %s',
+                 len(hdl_files), len(tcl_files), hdl_dir)
     if _logger.isEnabledFor(logging.DEBUG):
-      for _, _, files in os.walk(hdl_dir):
-        for filename in files:
-          _logger.debug('packing: %s', filename)
+      for filename in hdl_files + tcl_files:
+        _logger.debug('packing: %s', filename)
 
     bus_ifaces: List[str] = list(map(BUS_IFACE.format, iface_names))
     for m_axi_name in m_axi_names:
@@ -174,18 +400,44 @@ class PackageXo(Vivado):
     kwargs = {
         'top_name': top_name,
         'kernel_xml': kernel_xml,
-        'hdl_dir': hdl_dir,
+        'hdl_files': _tcl_list(os.path.join(hdl_dir, x) for x in hdl_files),
+        'tcl_files': _tcl_list(os.path.join(hdl_dir, x) for x in tcl_files),
         'xo_file': xo_file,
         'bus_ifaces': ''.join(bus_ifaces),
         'tmpdir': self.tmpdir.name,
         'cpp_kernels': ''.join(map(' -kernel_files {}'.format, cpp_kernels)),
         'part_num': f' -part {part_num}' if part_num else '',
+        'max_threads': max_threads,
     }
+
+    self.cache_file = _get_build_cache_file(
+        'xo',
+        'vivado',
+        ('XILINX_VIVADO',),
+        '.xo',
+        PACKAGEXO_COMMANDS.encode(),
+        top_name.encode(),
+        kwargs['bus_ifaces'].encode(),
+        kwargs['part_num'].encode(),
+        kernel_xml,
+        *cpp_kernels,
+        *(x for hdl_file in hdl_files + tcl_files
+          for x in (hdl_file.encode(), os.path.join(hdl_dir, hdl_file))),
+    )
+    if self.cache_file is not None and os.path.isfile(self.cache_file):
+      _logger.info('using cached xo file: %s', self.cache_file)
+      shutil.copyfile(self.cache_file, xo_file)
+      self._init_cache_hit(['vivado'])
+      return
+
     super().__init__(PACKAGEXO_COMMANDS.format(**kwargs))
 
   def __exit__(self, *args) -> None:
     super().__exit__(*args)
     self.tmpdir.cleanup()
+    if (self.cache_file is not None and not self.cache_hit and
+        self.returncode == 0):
+      _store_build_cache(self.xo_file, self.cache_file)
 
 
 HLS_COMMANDS = r'''
@@ -204,8 +456,58 @@ csynth_design
 exit
 '''
 
+# HLS reports and HDL files can be many megabytes; copy them in larger chunks
+TAR_COPY_BUFSIZE = 1 << 20
+
+# reports in the .autopilot/db directory to keep in addition to syn/report
+HLS_DB_REPORT_PATTERNS = (
+    '*.sched.adb.xml',
+    '*.verbose.sched.rpt',
+    '*.verbose.sched.rpt.xml',
+)
+
+
+def _add_tree(tar: tarfile.TarFile,
+              path: str,
+              arcname: str,
+              entry: Optional['os.DirEntry[str]'] = None) -> None:
+  """Recursively add path to tar as arcname, like TarFile.add.
 
-class RunHls(VivadoHls):
+  Directories are scanned with os.scandir and the stat results cached in each
+  os.DirEntry are reused, instead of stat-ing every entry again. Entries that
+  are neither regular files nor directories are added by TarFile.add.
+
+  Args:
+    tar: TarFile to add to.
+    path: Path of the file or directory to add.
+    arcname: Name of path in the archive.
+    entry: Optional os.DirEntry of path.
+
+  Raises:
+    FileNotFoundError: If path does not exist.
+  """
+  st = os.lstat(path) if entry is None else entry.stat(follow_symlinks=False)
+  if not (stat.S_ISREG(st.st_mode) or stat.S_ISDIR(st.st_mode)):
+    tar.add(path, arcname, recursive=False)
+    return
+  info = tarfile.TarInfo(arcname)
+  info.mode = stat.S_IMODE(st.st_mode)
+  info.uid = st.st_uid
+  info.gid = st.st_gid
+  info.mtime = int(st.st_mtime)
+  if stat.S_ISDIR(st.st_mode):
+    info.type = tarfile.DIRTYPE
+    tar.addfile(info)
+    with os.scandir(path) as entries:
+      for child in sorted(entries, key=lambda x: x.name):
+        _add_tree(tar, child.path, f'{arcname}/{child.name}', child)
+  else:
+    info.size = st.st_size
+    with open(path, 'rb') as fileobj:
+      tar.addfile(info, fileobj)
+
+
+class RunHls(_CachedPopen, VivadoHls):
   """Runs Vivado HLS for the given kernels and generate HDL files
 
   This is a subclass of subprocess.Popen. A temporary directory will be created
@@ -221,6 +523,10 @@ class RunHls(VivadoHls):
     auto_prefix: In `config_rtl`, add `-auto_prefix` or not. Note that Vitis HLS
         2020.2 enables this option regardless of the option here.
     hls: Either 'vivado_hls' or 'vitis_hls'.
+
+  If $HAODA_BUILD_CACHE is 1, the generated tarball is cached by the hash of
+  the inputs, and HLS is not launched if a cached tarball is found. Note that
+  only the kernel files themselves are hashed, not the headers they include.
   """
 
   def __init__(
@@ -242,14 +548,20 @@ class RunHls(VivadoHls):
     self.solution_name = top_name
     self.tarfileobj = tarfileobj
     self.hls = hls
+    self.cache_file: Optional[str] = None
+    self.cache_hit = False
     kernels = []
+    cache_inputs: List[Union[str, bytes]] = []
     for kernel_file in kernel_files:
       if isinstance(kernel_file, str):
         kernels.append(
             f'add_files "{{}}" -cflags "-std={std}"'.format(kernel_file))
+        cache_inputs.extend((kernel_file, f'-std={std}'.encode()))
       else:
         kernels.append(
             f'add_files "{{}}" -cflags "-std={std} {{}}"'.format(*kernel_file))
+        cache_inputs.extend(
+            (kernel_file[0], f'-std={std} {kernel_file[1]}'.encode()))
     rtl_config = 'config_rtl -reset_level ' + ('low' if reset_low else 'high')
     if auto_prefix:
       if hls == 'vivado_hls':
@@ -267,40 +579,171 @@ class RunHls(VivadoHls):
         'config': rtl_config,
         'other_configs': other_configs,
     }
+
+    env_names = ('XILINX_HLS', 'XILINX_VITIS')
+    if hls == 'vivado_hls':
+      env_names = ('XILINX_VIVADO',)
+    self.cache_file = _get_build_cache_file(
+        'hls',
+        hls,
+        env_names,
+        '.tar',
+        HLS_COMMANDS.format(**{
+            **kwargs,
+            'project_dir': '',
+            'add_kernels': '',
+        }).encode(),
+        *cache_inputs,
+    )
+    if self.cache_file is not None and os.path.isfile(self.cache_file):
+      _logger.info('using cached HLS results: %s', self.cache_file)
+      self._init_cache_hit([hls])
+      return
+
     super().__init__(HLS_COMMANDS.format(**kwargs), hls, self.project_dir.name)
 
   def __exit__(self, *args):
-    # wait for process termination and keep the log
-    subprocess.Popen.__exit__(self, *args)
-    if self.returncode == 0:
-      with tarfile.open(mode='w', fileobj=self.tarfileobj) as tar:
-        solution_dir = os.path.join(self.project_dir.name, self.project_name,
-                                    self.solution_name)
-        try:
-          tar.add(os.path.join(solution_dir, 'syn/report'), arcname='report')
-          tar.add(os.path.join(solution_dir, 'syn/verilog'), arcname='hdl')
-          tar.add(os.path.join(solution_dir, self.project_dir.name,
-                               f'{self.hls}.log'),
-                  arcname='log/' + self.solution_name + '.log')
-          for pattern in ('*.sched.adb.xml', '*.verbose.sched.rpt',
-                          '*.verbose.sched.rpt.xml'):
-            for f in glob.glob(
-                os.path.join(solution_dir, '.autopilot', 'db', pattern)):
-              tar.add(f, arcname='report/' + os.path.basename(f))
-        except FileNotFoundError as e:
-          self.returncode = 1
-          _logger.error('%s', e)
+    if self.cache_hit:
+      with open(self.cache_file, 'rb') as cache:
+        shutil.copyfileobj(cache, self.tarfileobj, TAR_COPY_BUFSIZE)
+    else:
+      # wait for process termination and keep the log
+      subprocess.Popen.__exit__(self, *args)
+      if self.returncode == 0:
+        if self.cache_file is None:
+          self._write_tar(self.tarfileobj)
+        else:
+          tar_name = os.path.join(self.project_dir.name, 'result.tar')
+          with open(tar_name, 'wb') as tarfileobj:
+            self._write_tar(tarfileobj)
+          if self.returncode == 0:
+            _store_build_cache(tar_name, self.cache_file)
+            with open(tar_name, 'rb') as tarfileobj:
+              shutil.copyfileobj(tarfileobj, self.tarfileobj,
+                                 TAR_COPY_BUFSIZE)
     super().__exit__(*args)
     self.project_dir.cleanup()
 
+  def _write_tar(self, fileobj: BinaryIO) -> None:
+    # fileobj may be unbuffered; let the stream coalesce small writes
+    with tarfile.open(mode='w|',
+                      fileobj=fileobj,
+                      bufsize=TAR_COPY_BUFSIZE,
+                      copybufsize=TAR_COPY_BUFSIZE) as tar:
+      solution_dir = os.path.join(self.project_dir.name, self.project_name,
+                                  self.solution_name)
+      try:
+        _add_tree(tar, os.path.join(solution_dir, 'syn/report'), 'report')
+        _add_tree(tar, os.path.join(solution_dir, 'syn/verilog'), 'hdl')
+        _add_tree(tar,
+                  os.path.join(self.project_dir.name, f'{self.hls}.log'),
+                  'log/' + self.solution_name + '.log')
+        try:
+          with os.scandir(os.path.join(solution_dir, '.autopilot',
+                                       'db')) as entries:
+            db_entries = sorted(entries, key=lambda x: x.name)
+        except FileNotFoundError:
+          db_entries = []
+        for entry in db_entries:
+          if any(
+              fnmatch.fnmatchcase(entry.name, pattern)
+              for pattern in HLS_DB_REPORT_PATTERNS):
+            _add_tree(tar, entry.path, 'report/' + entry.name, entry)
+      except FileNotFoundError as e:
+        self.returncode = 1
+        _logger.error('%s', e)
+
+
+class RunHlsPool:
+  """Runs RunHls and PackageXo concurrently in bounded thread pools.
+
+  HLS and packaging have separate pools so that long-running HLS tasks do not
+  starve packaging tasks (and vice versa).
+
+  Args:
+    max_workers: Maximum number of concurrent RunHls processes.
+    max_package_workers: Maximum number of concurrent PackageXo processes,
+        default to max_workers.
+  """
+
+  def __init__(self,
+               max_workers: int,
+               max_package_workers: Optional[int] = None):
+    if max_package_workers is None:
+      max_package_workers = max_workers
+    self._hls_executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers, thread_name_prefix='run-hls')
+    self._package_executor = concurrent.futures.ThreadPoolExecutor(
+        max_package_workers, thread_name_prefix='package-xo')
+
+  def __enter__(self) -> 'RunHlsPool':
+    return self
+
+  def __exit__(self, *args) -> None:
+    self.shutdown()
+
+  def submit(self, *args, **kwargs) -> 'concurrent.futures.Future[bytes]':
+    """Submit a RunHls task.
+
+    Args:
+      *args: Arguments to RunHls, without tarfileobj.
+      **kwargs: Keyword arguments to RunHls, without tarfileobj.
+
+    Returns:
+      Future of the content of the tarball generated by RunHls. The future
+      raises subprocess.CalledProcessError if RunHls fails.
+    """
+    return self._hls_executor.submit(self._run_hls, *args, **kwargs)
+
+  def submit_package_xo(self, *args,
+                        **kwargs) -> 'concurrent.futures.Future[None]':
+    """Submit a PackageXo task.
+
+    Args:
+      *args: Arguments to PackageXo.
+      **kwargs: Keyword arguments to PackageXo.
+
+    Returns:
+      Future of the PackageXo task. The future raises
+      subprocess.CalledProcessError if PackageXo fails.
+    """
+    return self._package_executor.submit(self._run, PackageXo, *args, **kwargs)
+
+  def shutdown(self, wait: bool = True) -> None:
+    self._hls_executor.shutdown(wait)
+    self._package_executor.shutdown(wait)
+
+  @staticmethod
+  def _run_hls(*args, **kwargs) -> bytes:
+    with tempfile.TemporaryFile() as tarfileobj:
+      RunHlsPool._run(RunHls, tarfileobj, *args, **kwargs)
+      tarfileobj.seek(0)
+      return tarfileobj.read()
+
+  @staticmethod
+  def _run(popen_cls, *args, **kwargs) -> None:
+    with popen_cls(*args, **kwargs) as proc:
+      stdout, stderr = proc.communicate()
+    # returncode may be updated in __exit__
+    if proc.returncode != 0:
+      raise subprocess.CalledProcessError(proc.returncode, proc.args, stdout,
+                                          stderr)
+
 
 XILINX_XML_NS = {'xd': 'http://www.xilinx.com/xd'}
+# Tags of the children of the root on the path to platformInfo, as in
+# './xd:component/xd:platformInfo'.
+PLATFORM_INFO_PATH = [
+    '{{{xd}}}component'.format(**XILINX_XML_NS),
+    '{{{xd}}}platformInfo'.format(**XILINX_XML_NS),
+]
 
 
-def get_device_info(platform_path: str):
+def get_device_info(platform_path: str) -> Dict[str, str]:
   """Extract device part number and target frequency from SDAccel platform.
 
-  Currently only support 5.x platforms.
+  Currently only support 5.x platforms. Results are cached by the resolved
+  platform path; each call returns a new dict.
 
   Args:
     platform_path: Path to the platform directory, e.g.,
@@ -309,19 +752,39 @@ def get_device_info(platform_path: str):
   Raises:
     ValueError: If cannot parse the platform properly.
   """
+  return dict(_get_device_info(os.path.realpath(platform_path)))
+
+
+@functools.lru_cache(maxsize=None)
+def _get_device_info(platform_path: str) -> Mapping[str, str]:
   device_name = os.path.basename(platform_path)
+  platform_file = None
   try:
-    platform_file = next(
-        glob.iglob(os.path.join(glob.escape(platform_path), 'hw', f'*.[xd]sa')))
-  except StopIteration as e:
-    raise ValueError('cannot find platform file for %s' % device_name) from e
+    with os.scandir(os.path.join(platform_path, 'hw')) as entries:
+      platform_file = next(
+          (x.path for x in entries if x.name.endswith(('.xsa', '.dsa'))), None)
+  except FileNotFoundError:
+    pass
+  if platform_file is None:
+    raise ValueError('cannot find platform file for %s' % device_name)
   with zipfile.ZipFile(platform_file) as platform:
     # platform_file must end with .xsa or .dsa, thus [:-4]
     with platform.open(os.path.basename(platform_file)[:-4] +
                        '.hpfm') as metadata:
-      platform_info = ET.parse(metadata).find('./xd:component/xd:platformInfo',
-                                              XILINX_XML_NS)
-      if platform_info is None:
+      # stop parsing as soon as platformInfo is complete, and clear everything
+      # else in the (potentially large) metadata as soon as it is parsed
+      path: List[str] = []  # tags of the ancestors of the current element
+      for event, elem in ET.iterparse(metadata, events=('start', 'end')):
+        if event == 'start':
+          path.append(elem.tag)
+          continue
+        path.pop()
+        if len(path) == 2 and [path[1], elem.tag] == PLATFORM_INFO_PATH:
+          platform_info = elem
+          break
+        if path[1:3] != PLATFORM_INFO_PATH:
+          elem.clear()
+      else:
         raise ValueError('cannot parse platform')
       clock_period = platform_info.find(
           "./xd:systemClocks/xd:clock/[@xd:id='0']", XILINX_XML_NS)
@@ -330,12 +793,95 @@ def get_device_info(platform_path: str):
       part_num = platform_info.find('xd:deviceInfo', XILINX_XML_NS)
       if part_num is None:
         raise ValueError('cannot find part number in platform')
-      return {
+      return types.MappingProxyType({
           'clock_period':
               clock_period.attrib['{{{xd}}}period'.format(**XILINX_XML_NS)],
           'part_num':
               part_num.attrib['{{{xd}}}name'.format(**XILINX_XML_NS)]
-      }
+      })
+
+
+def get_device_info_batch(
+    platform_paths: Iterable[str],
+    max_workers: Optional[int] = None,
+) -> Dict[str, Mapping[str, str]]:
+  """Extract device info from multiple platforms in parallel.
+
+  Each platform is parsed by get_device_info in a process pool, with each
+  worker pinned to a different CPU core if supported.
+
+  Args:
+    platform_paths: Paths to the platform directories.
+    max_workers: Maximum number of worker processes, default to the number of
+        processors.
+
+  Returns:
+    Dict mapping each path in platform_paths to its device info.
+
+  Raises:
+    ValueError: If cannot parse any of the platforms properly.
+  """
+  platform_paths = tuple(platform_paths)
+  real_paths = tuple(dict.fromkeys(map(os.path.realpath, platform_paths)))
+  with concurrent.futures.ProcessPoolExecutor(
+      max_workers,
+      initializer=_pin_to_core,
+      initargs=(multiprocessing.Value('i', 0),),
+  ) as executor:
+    device_infos = dict(
+        zip(real_paths, executor.map(_get_device_info_dict, real_paths)))
+  return {
+      path: types.MappingProxyType(device_infos[os.path.realpath(path)])
+      for path in platform_paths
+  }
+
+
+def _get_device_info_dict(platform_path: str) -> Dict[str, str]:
+  # MappingProxyType is not picklable
+  return dict(_get_device_info(platform_path))
+
+
+def _pin_to_core(counter: 'multiprocessing.sharedctypes.Synchronized') -> None:
+  """Pin the current process to a core based on a shared counter."""
+  if not hasattr(os, 'sched_setaffinity'):
+    return
+  cores = sorted(os.sched_getaffinity(0))
+  with counter.get_lock():
+    idx = counter.value
+    counter.value += 1
+  os.sched_setaffinity(0, {cores[idx % len(cores)]})
+
+
+def find_platform(platform: str) -> Optional[str]:
+  """Find the platform directory.
+
+  The platform name is normalized (':' and '.' replaced by '_') and then looked
+  up as-is, and under the 'platforms' directory of '/opt/xilinx',
+  $XILINX_VITIS, and $XILINX_SDX, in that order.
+
+  Args:
+    platform: Path or name of the platform, e.g.,
+        'xilinx_u200_qdma_201830_2' or 'xilinx:u200:qdma:201830.2'.
+
+  Returns:
+    Path to the platform directory, or None if not found.
+  """
+  platform = os.path.join(
+      os.path.dirname(platform),
+      os.path.basename(platform).replace(':', '_').replace('.', '_'))
+  if os.path.isdir(platform):
+    return platform
+  for platform_dir in (
+      os.path.join('/', 'opt', 'xilinx'),
+      os.environ.get('XILINX_VITIS'),
+      os.environ.get('XILINX_SDX'),
+  ):
+    if platform_dir is None:
+      continue
+    candidate = os.path.join(platform_dir, 'platforms', platform)
+    if os.path.isdir(candidate):
+      return candidate
+  return None
 
 
 def parse_device_info(
@@ -345,57 +891,20 @@ def parse_device_info(
     part_num_name: str,
     clock_period_name: str,
 ) -> Dict[str, str]:
-  platform = getattr(args, platform_name)
-  part_num = getattr(args, part_num_name)
-  clock_period = getattr(args, clock_period_name)
   option_string_table = {
       x.dest: x.option_strings[0]
       for x in getattr(parser, '_actions')
       if x.dest in {platform_name, part_num_name, clock_period_name}
   }
-  raw_platform_input = platform
-
-  if platform is not None:
-    platform = os.path.join(
-        os.path.dirname(platform),
-        os.path.basename(platform).replace(':', '_').replace('.', '_'))
-  if platform is not None:
-    for platform_dir in (
-        os.path.join('/', 'opt', 'xilinx'),
-        os.environ.get('XILINX_VITIS'),
-        os.environ.get('XILINX_SDX'),
-    ):
-      if not os.path.isdir(platform) and platform_dir is not None:
-        platform = os.path.join(platform_dir, 'platforms', platform)
-    if not os.path.isdir(platform):
-      parser.error(
-          f"cannot find the specified platform '{raw_platform_input}'; "
-          "are you sure it has been installed, "
-          "e.g., in '/opt/xilinx/platforms'?")
-  if platform is None or not os.path.isdir(platform):
-    if clock_period is None:
-      parser.error(
-          'cannot determine the target clock period; '
-          f"please either specify '{option_string_table[platform_name]}' "
-          'so the target clock period can be extracted from it, or '
-          f"specify '{option_string_table[clock_period_name]}' directly")
-    if part_num is None:
-      parser.error(
-          'cannot determine the target part number; '
-          f"please either specify '{option_string_table[platform_name]}' "
-          'so the target part number can be extracted from it, or '
-          f"specify '{option_string_table[part_num_name]}' directly")
-    device_info = {
-        'clock_period': clock_period,
-        'part_num': part_num,
-    }
-  else:
-    device_info = get_device_info(platform)
-    if clock_period is not None:
-      device_info['clock_period'] = clock_period
-    if part_num is not None:
-      device_info['part_num'] = part_num
-  return device_info
+  return _parse_device_info(
+      platform=getattr(args, platform_name),
+      part_num=getattr(args, part_num_name),
+      clock_period=getattr(args, clock_period_name),
+      error=parser.error,
+      platform_option=option_string_table[platform_name],
+      part_num_option=option_string_table[part_num_name],
+      clock_period_option=option_string_table[clock_period_name],
+  )
 
 
 def parse_device_info_from_flags(
@@ -404,41 +913,63 @@ def parse_device_info_from_flags(
     clock_period_name: str,
     flags: absl.flags.FlagValues = absl.flags.FLAGS,
 ) -> Dict[str, str]:
-  platform = getattr(flags, platform_name)
-  part_num = getattr(flags, part_num_name)
-  clock_period = getattr(flags, clock_period_name)
+
+  def error(message: str) -> NoReturn:
+    raise absl.flags.IllegalFlagValueError(message)
+
+  return _parse_device_info(
+      platform=getattr(flags, platform_name),
+      part_num=getattr(flags, part_num_name),
+      clock_period=getattr(flags, clock_period_name),
+      error=error,
+      platform_option=f'--{platform_name}',
+      part_num_option=f'--{part_num_name}',
+      clock_period_option=f'--{clock_period_name}',
+  )
+
+
+def _parse_device_info(
+    platform: Optional[str],
+    part_num: Optional[str],
+    clock_period: Optional[str],
+    error: Callable[[str], NoReturn],
+    platform_option: str,
+    part_num_option: str,
+    clock_period_option: str,
+) -> Dict[str, str]:
+  """Determine device info from a platform and/or explicit values.
+
+  Args:
+    platform: Optional path or name of the platform.
+    part_num: Optional part number, overriding the one from the platform.
+    clock_period: Optional clock period, overriding the one from the platform.
+    error: Callable that reports the given error message and never returns.
+    platform_option: Option string of platform used in error messages.
+    part_num_option: Option string of part_num used in error messages.
+    clock_period_option: Option string of clock_period used in error messages.
+
+  Returns:
+    Dict of 'clock_period' and 'part_num'.
+  """
   raw_platform_input = platform
 
   if platform is not None:
-    platform = os.path.join(
-        os.path.dirname(platform),
-        os.path.basename(platform).replace(':', '_').replace('.', '_'))
-  if platform is not None:
-    for platform_dir in (
-        os.path.join('/', 'opt', 'xilinx'),
-        os.environ.get('XILINX_VITIS'),
-        os.environ.get('XILINX_SDX'),
-    ):
-      if not os.path.isdir(platform) and platform_dir is not None:
-        platform = os.path.join(platform_dir, 'platforms', platform)
-    if not os.path.isdir(platform):
-      absl.flags.IllegalFlagValueError(
-          f"cannot find the specified platform '{raw_platform_input}'; "
-          "are you sure it has been installed, "
-          "e.g., in '/opt/xilinx/platforms'?")
-  if platform is None or not os.path.isdir(platform):
+    platform = find_platform(platform)
+    if platform is None:
+      error(f"cannot find the specified platform '{raw_platform_input}'; "
+            "are you sure it has been installed, "
+            "e.g., in '/opt/xilinx/platforms'?")
+  if platform is None:
     if clock_period is None:
-      raise absl.flags.IllegalFlagValueError(
-          'cannot determine the target clock period; '
-          f"please either specify '--{platform_name}' "
-          'so the target clock period can be extracted from it, or '
-          f"specify '--{clock_period_name}' directly")
+      error('cannot determine the target clock period; '
+            f"please either specify '{platform_option}' "
+            'so the target clock period can be extracted from it, or '
+            f"specify '{clock_period_option}' directly")
     if part_num is None:
-      raise absl.flags.IllegalFlagValueError(
-          'cannot determine the target part number; '
-          f"please either specify '--{platform_name}' "
-          'so the target part number can be extracted from it, or '
-          f"specify '--{part_num_name}' directly")
+      error('cannot determine the target part number; '
+            f"please either specify '{platform_option}' "
+            'so the target part number can be extracted from it, or '
+            f"specify '{part_num_option}' directly")
     device_info = {
         'clock_period': clock_period,
         'part_num': part_num,
@@ -481,6 +1012,13 @@ ARG_TEMPLATE = '''
 '''
 
 
+# The kernel.xml fragments are short enough that str.format is faster than a
+# pre-parsed template; only strip their trailing newlines once.
+_format_m_axi_port = M_AXI_PORT_TEMPLATE.rstrip('\n').format
+_format_axis_port = AXIS_PORT_TEMPLATE.rstrip('\n').format
+_format_arg = ARG_TEMPLATE.rstrip('\n').format
+
+
 def print_kernel_xml(name: str, args: Iterable[Arg], kernel_xml: TextIO):
   """Generate kernel.xml file.
 
@@ -490,8 +1028,9 @@ def print_kernel_xml(name: str, args: Iterable[Arg], kernel_xml: TextIO):
         could be an empty string to connect the argument to a default port.
     kernel_xml: File object to write to.
   """
-  kernel_ports = ''
-  kernel_args = ''
+  kernel_ports: List[str] = []
+  kernel_args: List[str] = []
+  escape = xml.sax.saxutils.escape
   offset = 0x10
   has_s_axi_control = False
   for arg_id, arg in enumerate(args):
@@ -507,39 +1046,38 @@ def print_kernel_xml(name: str, args: Iterable[Arg], kernel_xml: TextIO):
       addr_qualifier = 1  # mmap
       size = host_size = 8  # 64-bit
       port_name = M_AXI_PREFIX + (arg.port or arg.name)
-      kernel_ports += M_AXI_PORT_TEMPLATE.format(name=arg.port or arg.name,
-                                                 width=arg.width).rstrip('\n')
+      kernel_ports.append(
+          _format_m_axi_port(name=arg.port or arg.name, width=arg.width))
     elif arg.cat in {Cat.ISTREAM, Cat.OSTREAM}:
       is_stream = True
       addr_qualifier = 4  # stream
       size = host_size = 8  # 64-bit
       port_name = arg.port or arg.name
       mode = 'read_only' if arg.cat == Cat.ISTREAM else 'write_only'
-      kernel_ports += AXIS_PORT_TEMPLATE.format(name=arg.name,
-                                                mode=mode,
-                                                width=arg.width).rstrip('\n')
+      kernel_ports.append(
+          _format_axis_port(name=arg.name, mode=mode, width=arg.width))
     else:
       raise NotImplementedError(f'unknown arg category: {arg.cat}')
-    kernel_args += ARG_TEMPLATE.format(name=arg.name,
-                                       addr_qualifier=addr_qualifier,
-                                       arg_id=arg_id,
-                                       port_name=port_name,
-                                       c_type=xml.sax.saxutils.escape(
-                                           arg.ctype),
-                                       size=size,
-                                       offset=0 if is_stream else offset,
-                                       host_size=host_size).rstrip('\n')
+    kernel_args.append(
+        _format_arg(name=arg.name,
+                    addr_qualifier=addr_qualifier,
+                    arg_id=arg_id,
+                    port_name=port_name,
+                    c_type=escape(arg.ctype),
+                    size=size,
+                    offset=0 if is_stream else offset,
+                    host_size=host_size))
     if not is_stream:
       offset += size + 4
   hw_ctrl_protocol = 'ap_ctrl_none'
   if has_s_axi_control:
     hw_ctrl_protocol = 'ap_ctrl_hs'
-    kernel_ports += S_AXI_PORT.rstrip('\n')
+    kernel_ports.append(S_AXI_PORT.rstrip('\n'))
   kernel_xml.write(
       KERNEL_XML_TEMPLATE.format(
           name=name,
-          ports=kernel_ports,
-          args=kernel_args,
+          ports=''.join(kernel_ports),
+          args=''.join(kernel_args),
           hw_ctrl_protocol=hw_ctrl_protocol,
       ))
 
@@ -547,10 +1085,16 @@ def print_kernel_xml(name: str, args: Iterable[Arg], kernel_xml: TextIO):
 def get_cmd_args(
     cmd_args: List[str],
     env_names: Iterable[str],
-    kwargs: Dict[str, bool],
+    kwargs: Dict[str, Any],
 ) -> Union[List[str], str]:
   """Get command arguments for subprocess.Popen with specified environment.
 
+  The environment set up by env_name/settings64.sh is captured once and cached,
+  so that later processes can be launched directly with it if neither kwargs
+  specifies an environment nor os.environ has changed since the capture.
+  Otherwise, the command is wrapped to source settings64.sh in a shell, so that
+  the script extends the actual environment, e.g., PATH, of the process.
+
   Args:
     cmd_args: The original command arguments.
     env_names: Environment variable names to try.
@@ -566,18 +1110,63 @@ def get_cmd_args(
     if env_value is not None:
       settings = f'{env_value}/settings64.sh'
       if os.path.isfile(settings):
+        if 'env' not in kwargs:
+          try:
+            env_before, env_after = _get_settings_env(settings)
+          except (OSError, subprocess.CalledProcessError) as e:
+            _logger.warning('failed to source %s: %s', settings, e)
+          else:
+            if os.environ == env_before:
+              kwargs['env'] = dict(env_after)
+              return cmd_args
         kwargs['shell'] = True
         kwargs['executable'] = 'bash'
-        return ' '.join([
-            'source',
-            shlex.quote(settings),
-            ';',
-            'exec',
-            *map(shlex.quote, cmd_args),
-        ])
+        return f'source {shlex.quote(settings)} ; exec {shlex.join(cmd_args)}'
   return cmd_args
 
 
+# Variables maintained by bash itself rather than set by the settings scripts.
+_BASH_VARS = ('_', 'OLDPWD', 'SHLVL')
+
+
+@functools.lru_cache(maxsize=None)
+def _get_settings_env(
+    settings: str) -> Tuple[Mapping[str, str], Mapping[str, str]]:
+  """Get the environment set up by sourcing settings.
+
+  Failures raise and thus are not cached.
+
+  Args:
+    settings: Path to the settings script.
+
+  Returns:
+    The environment before and after sourcing settings.
+
+  Raises:
+    OSError: If bash cannot be executed.
+    subprocess.CalledProcessError: If sourcing settings fails.
+  """
+  env_before = dict(os.environ)
+  env = subprocess.run(
+      ['bash', '-c', f'source {shlex.quote(settings)} >/dev/null && env -0'],
+      stdout=subprocess.PIPE,
+      stderr=subprocess.DEVNULL,
+      check=True,
+  ).stdout
+  env_after = dict(
+      os.fsdecode(x).split('=', 1) for x in env.split(b'\0') if b'=' in x)
+  # PWD is only valid for the working directory at capture time, and the
+  # processes launched later may have their own.
+  env_after.pop('PWD', None)
+  # Keep the other variables that bash changed on its own as they were.
+  for name in _BASH_VARS:
+    env_after.pop(name, None)
+    if name in env_before:
+      env_after[name] = env_before[name]
+  return (types.MappingProxyType(env_before),
+          types.MappingProxyType(env_after))
+
+
 BRAM_FIFO_TEMPLATE = '''`default_nettype none
 
 // first-word fall-through (FWFT) FIFO using block RAM
@@ -911,16 +1500,69 @@ endmodule  // fifo
 '''
 
 
+def _compile_template(template: str) -> Callable[..., str]:
+  """Pre-parse a str.format template into a callable.
+
+  The returned callable takes keyword arguments only and gives the same result
+  as template.format(**kwargs), without parsing the template on every call.
+  Only plain field names with optional format specs are supported.
+
+  Args:
+    template: A str.format template.
+
+  Returns:
+    A callable that formats the template.
+  """
+  chunks: List[Tuple[str, Optional[str], str]] = []
+  for literal, field, spec, conversion in string.Formatter().parse(template):
+    if literal:
+      chunks.append((literal, None, ''))
+    if field is not None:
+      assert field.isidentifier() and conversion is None and '{' not in spec
+      chunks.append(('', field, spec))
+
+  def format_template(**kwargs) -> str:
+    return ''.join(literal if field is None else format(kwargs[field], spec)
+                   for literal, field, spec in chunks)
+
+  return format_template
+
+
+_format_bram_fifo = _compile_template(BRAM_FIFO_TEMPLATE)
+_format_srl_fifo = _compile_template(SRL_FIFO_TEMPLATE)
+
+
+@functools.lru_cache(maxsize=4096)
+def _render_bram_fifo(width: int, depth: int, name: str) -> str:
+  return _format_bram_fifo(width=width,
+                           depth=depth,
+                           name=name,
+                           addr_width=(depth - 1).bit_length())
+
+
+@functools.lru_cache(maxsize=4096)
+def _render_srl_fifo(width: int, depth: int, name: str) -> str:
+  addr_width = (depth - 1).bit_length()
+  return _format_srl_fifo(width=width,
+                          depth=depth,
+                          name=name,
+                          addr_width=addr_width,
+                          depth_width=addr_width + 1)
+
+
 class VerilogPrinter(util.Printer):
   """A text-based Verilog printer."""
+  __slots__ = ()
 
   def module(self, module_name: str, args: Iterable[str]) -> None:
-    self.println('module %s (' % module_name)
-    self.do_indent()
-    self._out.write(' ' * self._indent * self._tab)
-    self._out.write((',\n' + ' ' * self._indent * self._tab).join(args))
-    self.un_indent()
-    self.println('\n);')
+    indent = self._indent_str
+    prefix = indent + ' ' * self._tab
+    self._out.write(''.join((
+        f'{indent}module {module_name} ({self.eol}',
+        prefix,
+        (',\n' + prefix).join(args),
+        f'{indent}\n);{self.eol}',
+    )))
 
   def endmodule(self, module_name: Optional[str] = None) -> None:
     if module_name is None:
@@ -969,17 +1611,19 @@ class VerilogPrinter(util.Printer):
 
   def module_instance(self, module_name: str, instance_name: str,
                       args: Union[Mapping[str, str], Iterable[str]]) -> None:
-    self.println('{module_name} {instance_name}('.format(**locals()))
-    self.do_indent()
-    if isinstance(args, collections.Mapping):
-      self._out.write(',\n'.join(' ' * self._indent * self._tab +
-                                 '.{}({})'.format(*arg)
-                                 for arg in args.items()))
+    indent = self._indent_str
+    prefix = indent + ' ' * self._tab
+    if isinstance(args, collections.abc.Mapping):
+      body = ',\n'.join(
+          f'{prefix}.{key}({value})' for key, value in args.items())
     else:
-      self._out.write(',\n'.join(
-          ' ' * self._indent * self._tab + arg for arg in args))
-    self.un_indent()
-    self.println('\n);')
+      body = ',\n'.join(prefix + arg for arg in args)
+    # Write the whole instance at once instead of once per line.
+    self._out.write(''.join((
+        f'{indent}{module_name} {instance_name}({self.eol}',
+        body,
+        f'{indent}\n);{self.eol}',
+    )))
 
   def fifo_module(self,
                   width: int,
@@ -1003,9 +1647,9 @@ class VerilogPrinter(util.Printer):
       ValueError: If depth or width is invalid.
     """
     if width * depth > threshold:
-      self.bram_fifo_module(width, depth)
+      self.bram_fifo_module(width, depth, name)
     else:
-      self.srl_fifo_module(width, depth)
+      self.srl_fifo_module(width, depth, name)
 
   def bram_fifo_module(self, width: int, depth: int, name: str = '') -> None:
     """Generate BRAM FIFO with the given parameters.
@@ -1025,11 +1669,7 @@ class VerilogPrinter(util.Printer):
       raise ValueError('Invalid BRAM FIFO depth: %d < 1' % depth)
     if not name:
       name = 'fifo_w{width}_d{depth}_A'.format(width=width, depth=depth)
-    self._out.write(
-        BRAM_FIFO_TEMPLATE.format(width=width,
-                                  depth=depth,
-                                  name=name,
-                                  addr_width=(depth - 1).bit_length()))
+    self._out.write(_render_bram_fifo(width, depth, name))
 
   def srl_fifo_module(self, width: int, depth: int, name: str = '') -> None:
     """Generate SRL FIFO with the given parameters.
@@ -1049,10 +1689,4 @@ class VerilogPrinter(util.Printer):
       raise ValueError('Invalid SRL FIFO depth: %d < 1' % depth)
     if not name:
       name = 'fifo_w{width}_d{depth}_A'.format(width=width, depth=depth)
-    addr_width = (depth - 1).bit_length()
-    self._out.write(
-        SRL_FIFO_TEMPLATE.format(width=width,
-                                 depth=depth,
-                                 name=name,
-                                 addr_width=addr_width,
-                                 depth_width=addr_width + 1))
+    self._out.write(_render_srl_fifo(width, depth, name))
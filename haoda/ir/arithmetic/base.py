@@ -1,11 +1,10 @@
 import collections
 import functools
 import logging
-from collections import OrderedDict
 from typing import (Callable, Dict, Iterable, List, Mapping, Tuple, TypeVar,
                     overload)
 
-from haoda import ir, util
+from haoda import ir
 
 _logger = logging.getLogger().getChild(__name__)
 
@@ -17,46 +16,205 @@ __all__ = ('simplify',)
 
 # pylint: disable=function-redefined
 @overload
-def simplify(expr: NodeT, logger: Callable[..., None] = None) -> NodeT:
+def simplify(expr: NodeT,
+             logger: Callable[..., None] = None,
+             passes: Iterable[str] = ('flatten',)) -> NodeT:
   ...
 
 
 # pylint: disable=function-redefined
 @overload
-def simplify(expr: Iterable[NodeT], logger: Callable[..., None] = None) \
-    -> Iterable[NodeT]:
+def simplify(expr: Iterable[NodeT],
+             logger: Callable[..., None] = None,
+             passes: Iterable[str] = ('flatten',)) -> Iterable[NodeT]:
   ...
 
 
-def simplify(expr, logger=None):
+def simplify(expr, logger=None, passes=('flatten',)):
   """Simplifies expressions.
 
   Args:
     expr: A haoda.NodeT or a sequence of haoda.ir.Node.
+    passes: Names of the simplifications to apply, any of 'flatten' and
+        'distribute' (see reverse_distribute). If both are given, flatten is
+        applied first.
 
   Returns:
     Simplified haoda.ir.Node or sequence.
+
+  Raises:
+    ValueError: If passes contains an unknown name.
   """
 
+  passes = frozenset(passes)
+  unknown_passes = passes - {'flatten', 'distribute'}
+  if unknown_passes:
+    raise ValueError('unknown simplify passes: ' +
+                     ', '.join(sorted(unknown_passes)))
+
   if expr is None:
     if logger is not None:
       logger.debug('None expr, no simplification.')
     return expr
 
-  passes = flatten
-  if logger is not None:
-    passes = compose(passes, lambda node: print_tree(node, logger))
+  if passes == {'flatten'}:
+    simplify_pass = flatten
+  elif passes == {'distribute'}:
+    simplify_pass = reverse_distribute
+  elif passes:
+    simplify_pass = compose(flatten, reverse_distribute)
+  else:
+    simplify_pass = _identity
+
+  if logger is None:
+    simplify_node = simplify_pass
+  else:
+
+    def simplify_node(node):
+      return print_tree(simplify_pass(node), logger)
 
-  if isinstance(expr, collections.abc.Iterable):
-    return type(expr)(map(passes, expr))
+  # Check the common concrete containers first; ABC checks are much slower.
+  # Strings are iterable too, but are never a sequence of expressions.
+  if isinstance(expr, (list, tuple)) or (
+      isinstance(expr, collections.abc.Iterable) and
+      not isinstance(expr, (str, bytes))):
+    return type(expr)(map(simplify_node, expr))
 
-  return passes(expr)
+  return simplify_node(expr)
 
 
 def compose(*funcs: Callable[[T], T]) -> Callable[[T], T]:
   """Composes functions. The first function in funcs are invoked the first.
   """
-  return functools.reduce(lambda g, f: lambda x: f(g(x)), funcs, lambda x: x)
+  if not funcs:
+    return _identity
+  if len(funcs) == 1:
+    return funcs[0]
+  if len(funcs) == 2:
+    first, second = funcs
+    return lambda x: second(first(x))
+  return functools.reduce(lambda g, f: lambda x: f(g(x)), funcs)
+
+
+# Operators after which an operand of the same type can be merged into its
+# parent; None stands for the first operand.
+_ASSOCIATIVE_OPERATORS = frozenset((None, '||', '&&', *'|&+*'))
+
+# Shared by every MulDiv that reverse_distribute creates, so that comparing
+# their operators hits the identity fast path of tuple equality.
+_MUL_OPERATOR = ('*',)
+
+
+def _flatten_binary_op(node: ir.BinaryOp) -> ir.Node:
+  # Flatten singleton BinaryOp
+  if len(node.operand) == 1:
+    return node.operand[0]
+
+  # Flatten BinaryOp with reduction operators
+  operators = node.operator
+  operands = node.operand
+  node_type = type(node)
+
+  # Find the first operand that can be merged without allocating anything, so
+  # that the common case of nothing to flatten is cheap. Merging a singleton
+  # adds no operand and does not count, as in the loop below.
+  for idx, child_operand in enumerate(operands):
+    if type(child_operand) is node_type and len(child_operand.operand) > 1 and (
+        idx == 0 or operators[idx - 1] in _ASSOCIATIVE_OPERATORS):
+      break
+  else:
+    return node
+
+  # Children are not flattened yet, so only operations nested directly are
+  # merged, not parenthesized ones, whose inner operators may not associate
+  # with ours. Merging is repeated until it no longer adds operands, as
+  # flattening the merged node again would do.
+  while True:
+    new_operator: List[str] = []
+    new_operand: List[ir.Expr] = []
+    for idx, child_operand in enumerate(operands):
+      if idx == 0:
+        child_operator = None
+      else:
+        child_operator = operators[idx - 1]
+        new_operator.append(child_operator)
+      # The first operator can always be flattened if two operations has the
+      # same type.
+      if child_operator in _ASSOCIATIVE_OPERATORS and \
+          type(child_operand) is node_type:
+        new_operator.extend(child_operand.operator)
+        new_operand.extend(child_operand.operand)
+      else:
+        new_operand.append(child_operand)
+    # Stop unless at least 1 operand is flattened.
+    if len(new_operand) <= len(operands):
+      break
+    operators, operands = new_operator, new_operand
+  return node_type(operator=operators, operand=operands)
+
+
+def _flatten_operand(node: ir.Operand) -> ir.Node:
+  # Flatten compound Operand
+  _, val = node._get_held()  # pylint: disable=protected-access
+  if isinstance(val, ir.Node):
+    return val
+  return node
+
+
+def _flatten_unary(node: ir.Unary) -> ir.Node:
+  # Flatten identity unary operators
+  operators = node.operator
+  minus_count = plus_count = not_count = 0
+  for operator in operators:
+    if operator == '-':
+      minus_count += 1
+    elif operator == '+':
+      plus_count += 1
+    elif operator == '!':
+      not_count += 1
+  if (minus_count & 1) == 0 and plus_count + minus_count == len(operators):
+    return node.operand
+  if (not_count & 1) == 0 and not_count == len(operators):
+    return node.operand
+  return node
+
+
+def _flatten_call(node: ir.Call,
+                  reduction_funcs=frozenset(ir.REDUCTION_FUNCS)) -> ir.Node:
+  # Flatten reduction functions
+  operator = node.name
+  if operator in reduction_funcs:
+    operands: List[ir.Expr] = []
+    for operand in node.arg:
+      if isinstance(operand, ir.Call) and operand.name == operator:
+        operands.extend(operand.arg)
+      else:
+        operands.append(operand)
+    if len(operands) > len(node.arg):
+      return ir.Call(name=operator, arg=operands)
+  return node
+
+
+_FLATTEN_RULES: Dict[type, Callable[[ir.Node], ir.Node]] = {
+    ir.BinaryOp: _flatten_binary_op,
+    ir.Operand: _flatten_operand,
+    ir.Unary: _flatten_unary,
+    ir.Call: _flatten_call,
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _get_flatten_rule(node_type: type) -> Callable[[ir.Node], ir.Node]:
+  """Returns the flatten rule of node_type, resolved through its MRO once."""
+  for base in node_type.__mro__:
+    rule = _FLATTEN_RULES.get(base)
+    if rule is not None:
+      return rule
+  return _identity
+
+
+def _identity(node: T) -> T:
+  return node
 
 
 def flatten(node: ir.Node) -> ir.Node:
@@ -88,68 +246,13 @@ def flatten(node: ir.Node) -> ir.Node:
   """
 
   def visitor(node: ir.Node, args=None) -> ir.Node:
-    if isinstance(node, ir.BinaryOp):
-
-      # Flatten singleton BinaryOp
-      if len(node.operand) == 1:
-        return flatten(node.operand[0])
-
-      # Flatten BinaryOp with reduction operators
-      new_operator: List[str] = []
-      new_operand: List[ir.Expr] = []
-      for child_operator, child_operand in zip((None, *node.operator),
-                                               node.operand):
-        if child_operator is not None:
-          new_operator.append(child_operator)
-        # The first operator can always be flattened if two operations has the
-        # same type.
-        if child_operator in (None, '||', '&&', *'|&+*') and \
-            type(child_operand) is type(node):
-          new_operator.extend(child_operand.operator)
-          new_operand.extend(child_operand.operand)
-        else:
-          new_operand.append(child_operand)
-      # At least 1 operand is flattened.
-      if len(new_operand) > len(node.operand):
-        return flatten(type(node)(operator=new_operator, operand=new_operand))
-
-    # Flatten compound Operand
-    if isinstance(node, ir.Operand):
-      for attr in node.ATTRS:
-        val = getattr(node, attr)
-        if val is not None:
-          if isinstance(val, ir.Node):
-            return flatten(val)
-          break
-      else:
-        raise util.InternalError('undefined Operand')
-
-    # Flatten identity unary operators
-    if isinstance(node, ir.Unary):
-      minus_count = node.operator.count('-')
-      if minus_count % 2 == 0:
-        plus_count = node.operator.count('+')
-        if plus_count + minus_count == len(node.operator):
-          return flatten(node.operand)
-      not_count = node.operator.count('!')
-      if not_count % 2 == 0 and not_count == len(node.operator):
-        return flatten(node.operand)
-
-    # Flatten reduction functions
-    if isinstance(node, ir.Call):
-      operator = getattr(node, 'name')
-      if operator in ir.REDUCTION_FUNCS:
-        operands: List[ir.Expr] = []
-        for operand in getattr(node, 'arg'):
-          if (isinstance(operand, ir.Call) and
-              getattr(operand, 'name') == operator):
-            operands.extend(getattr(operand, 'arg'))
-          else:
-            operands.append(operand)
-        if len(operands) > len(getattr(node, 'arg')):
-          return flatten(ir.Call(name=operator, arg=operands))
-
-    return node
+    # Invoked in pre-order, so that a parent only merges the children that
+    # are nested directly, not those that are parenthesized. A rewritten node
+    # is returned without recursion and must be flattened again.
+    result = _get_flatten_rule(type(node))(node)
+    if result is node:
+      return node
+    return flatten(result)
 
   if not isinstance(node, ir.Node):
     return node
@@ -171,57 +274,109 @@ def reverse_distribute(node: NodeT) -> NodeT:
   """
 
   def visitor(node: NodeT, left_distribute: bool) -> NodeT:
-    """Apply left- or right-distributive property in reverse, if possible
-
-    Args:
-      node: ir.Node to process.
-      left_distribute: Whether to apply *left*-distributive property.
-
-    Returns:
-      Processed node.
-    """
     if isinstance(node, ir.AddSub):
-      items = OrderedDict()  # type: Dict[ir.Node, List[Tuple[str, ir.Node]]]
-      new_operators = []
-      new_operands = []
-      for operator, operand in zip(('+',) + getattr(node, 'operator'),
-                                   getattr(node, 'operand')):
-        if (operator == '+' and isinstance(operand, ir.MulDiv) and
-            getattr(operand, 'operator') == ('*',)):
-          if left_distribute:
-            coeff, item = getattr(operand, 'operand')
-          else:
-            item, coeff = getattr(operand, 'operand')
-          items.setdefault(coeff, []).append((operator, item))
-        else:
-          new_operators.append(operator)
-          new_operands.append(operand)
-      for coeff, item in items.items():
-        operator, operand = zip(*item)
-        assert operator[0] == '+'
-        new_operators.append(operator[0])
-        if len(operand) > 1:
-          new_item = ir.AddSub(operator=operator[1:], operand=operand)
-        else:
-          new_item = operand[0]
-        if left_distribute:
-          children = coeff, new_item
-        else:
-          children = new_item, coeff
-        new_operands.append(ir.MulDiv(operator=('*',), operand=children))
-      if len(new_operands) > 1:
-        assert new_operators[0] == '+'
-        new_node = ir.AddSub(operator=tuple(new_operators[1:]),
-                             operand=tuple(new_operands))
-        if new_node != node:
-          return new_node  # type: ignore
-      elif new_operands and new_operands[0] != node:
-        return new_operands[0]
+      return _reverse_distribute_add_sub(node, left_distribute)
     return node
 
+  if not _has_product_term(node):
+    return node
   return node.visit(visitor, True).visit(visitor, False)
 
 
+def _reverse_distribute_add_sub(node: ir.AddSub,
+                                left_distribute: bool) -> ir.Node:
+  """Apply left- or right-distributive property in reverse, if possible
+
+  Args:
+    node: ir.AddSub to process.
+    left_distribute: Whether to apply *left*-distributive property.
+
+  Returns:
+    Processed node.
+  """
+  items: Dict[ir.Node, List[Tuple[str, ir.Node]]] = {}
+  new_operators = []
+  new_operands = []
+  products = []
+  for operator, operand in zip(('+',) + node.operator, node.operand):
+    if (operator == '+' and isinstance(operand, ir.MulDiv) and
+        operand.operator == _MUL_OPERATOR):
+      if left_distribute:
+        coeff, item = operand.operand
+      else:
+        item, coeff = operand.operand
+      items.setdefault(coeff, []).append((operator, item))
+      products.append(operand)
+    else:
+      new_operators.append(operator)
+      new_operands.append(operand)
+  # If no coefficient is shared, only the order of operands might change; do
+  # not rebuild any node unless it does.
+  if len(items) == len(products) and len(items) + len(new_operands) > 1:
+    if new_operators and new_operators[0] == '+':
+      operands = new_operands + products
+    else:
+      operands = products + new_operands
+    if all(a is b for a, b in zip(operands, node.operand)):
+      return node
+  product_operators = []
+  product_operands = []
+  for coeff, item in items.items():
+    operator, operand = zip(*item)
+    assert operator[0] == '+'
+    product_operators.append(operator[0])
+    if len(operand) > 1:
+      new_item = ir.AddSub(operator=operator[1:], operand=operand)
+    else:
+      new_item = operand[0]
+    if left_distribute:
+      children = coeff, new_item
+    else:
+      children = new_item, coeff
+    product_operands.append(ir.MulDiv(operator=_MUL_OPERATOR,
+                                      operand=children))
+  # Keep the remaining operands first unless the first of them is subtracted,
+  # e.g., a * b - c, which cannot lead an AddSub.
+  if new_operators and new_operators[0] == '+':
+    new_operators += product_operators
+    new_operands += product_operands
+  else:
+    new_operators = product_operators + new_operators
+    new_operands = product_operands + new_operands
+  if len(new_operands) > 1:
+    assert new_operators[0] == '+'
+    new_node = ir.AddSub(operator=tuple(new_operators[1:]),
+                         operand=tuple(new_operands))
+    if new_node != node:
+      return new_node
+  elif new_operands and new_operands[0] != node:
+    return new_operands[0]
+  return node
+
+
+def _has_product_term(node: ir.Node) -> bool:
+  """Returns whether any AddSub in node has a multiplication as its operand.
+
+  This is a necessary condition for reverse_distribute to change anything, and
+  is much cheaper to test than rebuilding the tree twice.
+  """
+  stack = [node]
+  while stack:
+    node = stack.pop()
+    if isinstance(node, ir.AddSub) and any(
+        isinstance(operand, ir.MulDiv) and operand.operator == _MUL_OPERATOR
+        for operand in node.operand):
+      return True
+    for attr in node.SCALAR_ATTRS:
+      child = getattr(node, attr)
+      if isinstance(child, ir.Node):
+        stack.append(child)
+    for attr in node.LINEAR_ATTRS:
+      stack.extend(child for child in getattr(node, attr)
+                   if isinstance(child, ir.Node))
+  return False
+
+
 def print_tree(node: NodeT,
                printer: Callable[[str], None] = _logger.debug) -> NodeT:
   """Prints the node as a tree.
@@ -258,6 +413,13 @@ def print_tree(node: NodeT,
   if not isinstance(node, ir.Node):
     return node
 
+  # Skip the walk entirely if printer is a logging method that is disabled.
+  logger = getattr(printer, '__self__', None)
+  if isinstance(logger, logging.Logger):
+    level = logging.getLevelName(printer.__name__.upper())
+    if isinstance(level, int) and not logger.isEnabledFor(level):
+      return node
+
   printer('root')
   return node.visit(visitor,
                     args=[1],
@@ -268,9 +430,10 @@ def print_tree(node: NodeT,
 def propagate_type(node: ir.Node, symbol_table: Mapping[str, ir.Type]):
 
   def visitor(node: ir.Node, symbol_table: Mapping[str, ir.Type]):
-    if node.haoda_type is None:
-      if isinstance(node, (ir.Ref, ir.Var)):
-        node.haoda_type = symbol_table[node.name]
+    # Test the node type first; haoda_type of a non-leaf node is inferred from
+    # its whole subtree, which would make this walk quadratic.
+    if isinstance(node, (ir.Ref, ir.Var)) and node.haoda_type is None:
+      node.haoda_type = symbol_table[node.name]
     return node
 
   return node.visit(visitor, symbol_table)
@@ -1,10 +1,11 @@
 import collections
 import copy
+import functools
+import heapq
 import logging
 import math
-from typing import Dict, List, Optional, Sequence, Tuple, Union
-
-import cached_property
+import weakref
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
 
 from haoda import ir, util
 from haoda.ir import visitor
@@ -75,7 +76,10 @@ OTHER_FUNCS = ('min', 'max', 'select')
 FUNCS = (tuple(map('/{}[fl]?/'.format, MATH_FUNCS)) +
          tuple(map("'{}'".format, STD_FUNCS + OTHER_FUNCS)))
 
-FUNC_NAME = 'FuncName: %s;' % '|'.join(FUNCS)
+# A single regular expression is matched in one pass rather than trying each
+# of FUNCS in turn; the alternatives keep the order of the ordered choice.
+FUNC_NAME = 'FuncName: /%s/;' % '|'.join(
+    tuple(map('{}[fl]?'.format, MATH_FUNCS)) + STD_FUNCS + OTHER_FUNCS)
 
 GRAMMAR = r'''
 Bin: /0[Bb][01]+([Uu][Ll][Ll]?|[Ll]?[Ll]?[Uu]?)/;
@@ -132,16 +136,21 @@ Var: name=ID ('[' idx=Int ']')*;
 
 # pylint: disable=protected-access
 
+# Values cached in Node.__dict__ that are derived from the other attributes.
+_DERIVED_CACHES = ('_hash', '_cached_identifier')
+
 
 class Node:
   """A immutable, hashable IR node.
   """
   SCALAR_ATTRS: Tuple[str, ...] = ()
   LINEAR_ATTRS: Tuple[str, ...] = ()
+  # SCALAR_ATTRS + LINEAR_ATTRS, concatenated once per class.
+  ATTRS: Tuple[str, ...] = ()
 
-  @property
-  def ATTRS(self) -> Tuple[str, ...]:
-    return self.SCALAR_ATTRS + self.LINEAR_ATTRS
+  def __init_subclass__(cls, **kwargs):
+    super().__init_subclass__(**kwargs)
+    cls.ATTRS = cls.SCALAR_ATTRS + cls.LINEAR_ATTRS
 
   def __init__(self, **kwargs):
     self._haoda_type = None
@@ -150,9 +159,33 @@ class Node:
     for attr in self.LINEAR_ATTRS:
       setattr(self, attr, tuple(kwargs.pop(attr)))
 
+  def __copy__(self) -> 'Node':
+    # Copies are made to be mutated, so they must not inherit cached values.
+    obj = type(self).__new__(type(self))
+    obj.__dict__.update(self.__dict__)
+    obj._drop_caches()
+    return obj
+
+  def _drop_caches(self) -> None:
+    for attr in _DERIVED_CACHES:
+      self.__dict__.pop(attr, None)
+
   def __hash__(self) -> int:
-    return hash((tuple(getattr(self, _) for _ in self.SCALAR_ATTRS),
-                 tuple(tuple(getattr(self, _)) for _ in self.LINEAR_ATTRS)))
+    # Hashing is structural and thus O(tree size); since nodes are immutable
+    # once constructed, compute it only once.
+    try:
+      return self.__dict__['_hash']
+    except KeyError:
+      pass
+    # LINEAR_ATTRS are already tuples and need no wrapping.
+    values = tuple([getattr(self, _) for _ in self.ATTRS])
+    result = hash(values)
+    # haoda_type may be reassigned in place, which changes the hash of the node
+    # and all its ancestors. Cache only if no such node is in the subtree, i.e.,
+    # the children's hashes are cached.
+    if 'haoda_type' not in self.ATTRS and _is_hash_cached(values):
+      self.__dict__['_hash'] = result
+    return result
 
   def __eq__(self, other) -> bool:
     if (getattr(self, 'haoda_type', None) is not None and
@@ -181,6 +214,7 @@ class Node:
 
   @haoda_type.setter
   def haoda_type(self, val: Union[None, str, ir.Type]) -> None:
+    self._drop_caches()
     if val is None:
       self._haoda_type = None
     elif isinstance(val, str):
@@ -229,6 +263,10 @@ class Node:
     If the same object is returned by the callback, if any attribute is
     changed, it will not be recursively visited. If an attribute is unchanged,
     it will be recursively visited.
+
+    The tree is walked with an explicit stack rather than recursion, so deep
+    trees do not hit the recursion limit. Callbacks are invoked in the same
+    order as a recursive depth-first walk.
     """
 
     def callback_wrapper(callback, obj, args):
@@ -239,42 +277,86 @@ class Node:
         return result
       return obj
 
-    self_copy = copy.copy(self)
-    obj = callback_wrapper(callback, self_copy, args)
-    if obj is not self_copy:
-      return obj
-    self_copy = callback_wrapper(pre_recursion, copy.copy(self), args)
-    scalar_attrs = {
-        attr: getattr(self_copy, attr).visit(
-            callback, args, pre_recursion, post_recursion) if isinstance(
-                getattr(self_copy, attr), Node) else getattr(self_copy, attr)
-        for attr in self_copy.SCALAR_ATTRS
-    }
-    linear_attrs = {
-        attr: tuple(
-            _.visit(callback, args, pre_recursion, post_recursion
-                   ) if isinstance(_, Node) else _
-            for _ in getattr(self_copy, attr))
-        for attr in self_copy.LINEAR_ATTRS
-    }
-
-    for attr in self.SCALAR_ATTRS:
-      # old attribute may not exist in mutated object
-      if not hasattr(obj, attr):
-        continue
-      if getattr(obj, attr) is getattr(self, attr):
-        if isinstance(getattr(obj, attr), Node):
-          setattr(obj, attr, scalar_attrs[attr])
-    for attr in self.LINEAR_ATTRS:
-      # old attribute may not exist in mutated object
-      if not hasattr(obj, attr):
+    # Each item is either (node,) to enter node, or (node, obj, src, count) to
+    # leave node after its count children pushed to results have been visited.
+    stack: List[tuple] = [(self,)]
+    results: List[Node] = []
+    while stack:
+      item = stack.pop()
+      if len(item) == 1:
+        node = item[0]
+        self_copy = copy.copy(node)
+        obj = self_copy if callback is None else callback(self_copy, args)
+        if obj is None:
+          obj = self_copy
+        elif obj is not self_copy:
+          results.append(obj)
+          continue
+        if pre_recursion is None:
+          # A shallow copy has the same attributes as node; skip copying again.
+          src = node
+        else:
+          src = callback_wrapper(pre_recursion, copy.copy(node), args)
+        children = []
+        for attr in src.SCALAR_ATTRS:
+          val = getattr(src, attr)
+          if isinstance(val, Node):
+            children.append((val,))
+        for attr in src.LINEAR_ATTRS:
+          children += [(_,) for _ in getattr(src, attr) if isinstance(_, Node)]
+        stack.append((node, obj, src, len(children)))
+        children.reverse()
+        stack += children
         continue
-      setattr(
-          obj, attr,
-          tuple(c if a is b and isinstance(a, Node) else a for a, b, c in zip(
-              getattr(obj, attr), getattr(self, attr), linear_attrs[attr])))
-    return callback_wrapper(post_recursion, obj, args)
 
+      node, obj, src, count = item
+      if count:
+        next_visited = iter(results[-count:]).__next__
+        del results[-count:]
+      scalar_attrs = {}
+      for attr in src.SCALAR_ATTRS:
+        val = getattr(src, attr)
+        scalar_attrs[attr] = next_visited() if isinstance(val, Node) else val
+      linear_attrs = {
+          attr: tuple([
+              next_visited() if isinstance(_, Node) else _
+              for _ in getattr(src, attr)
+          ]) for attr in src.LINEAR_ATTRS
+      }
+
+      for attr in node.SCALAR_ATTRS:
+        # old attribute may not exist in mutated object
+        if not hasattr(obj, attr):
+          continue
+        if getattr(obj, attr) is getattr(node, attr):
+          if isinstance(getattr(obj, attr), Node):
+            setattr(obj, attr, scalar_attrs[attr])
+      for attr in node.LINEAR_ATTRS:
+        # old attribute may not exist in mutated object
+        if not hasattr(obj, attr):
+          continue
+        setattr(
+            obj, attr,
+            tuple(c if a is b and isinstance(a, Node) else a
+                  for a, b, c in zip(getattr(obj, attr), getattr(node, attr),
+                                     linear_attrs[attr])))
+      # Attributes of obj may have been replaced.
+      obj._drop_caches()
+      if post_recursion is not None:
+        result = post_recursion(obj, args)
+        if result is not None:
+          obj = result
+      results.append(obj)
+    return results[0]
+
+
+def _is_hash_cached(val: Any) -> bool:
+  """Returns whether the hash of val and all nodes in it is cached."""
+  if isinstance(val, Node):
+    return '_hash' in val.__dict__
+  if isinstance(val, tuple):
+    return all(map(_is_hash_cached, val))
+  return True
 
 class Let(Node):
   SCALAR_ATTRS = 'haoda_type', 'name', 'expr'
@@ -317,10 +399,10 @@ class Ref(Node):
       self.lat = str2int(self.lat)
 
   def __str__(self):
-    result = '{}({})'.format(self.name, ', '.join(map(str, self.idx)))
-    if self.lat is not None:
-      result += ' ~{}'.format(self.lat)
-    return result
+    idx = ', '.join(map(str, self.idx))
+    if self.lat is None:
+      return f'{self.name}({idx})'
+    return f'{self.name}({idx}) ~{self.lat}'
 
 
 class BinaryOp(Node):
@@ -330,9 +412,10 @@ class BinaryOp(Node):
   operator: Sequence[str]
 
   def __str__(self):
-    result = str(self.operand[0])
+    parts = [str(self.operand[0])]
     for operator, operand in zip(self.operator, self.operand[1:]):
-      result += ' {} {}'.format(operator, operand)
+      parts += operator, str(operand)
+    result = ' '.join(parts)
     if self.singleton:
       return result
     return parenthesize(result)
@@ -342,9 +425,10 @@ class BinaryOp(Node):
     return self.operand[0].haoda_type
 
   def _get_expr(self, lang: str) -> str:
-    result = self.operand[0]._get_expr(lang)
+    parts = [self.operand[0]._get_expr(lang)]
     for operator, operand in zip(self.operator, self.operand[1:]):
-      result += ' {} {}'.format(operator, operand._get_expr(lang))
+      parts += operator, operand._get_expr(lang)
+    result = ' '.join(parts)
     if self.singleton:
       return result
     return parenthesize(result)
@@ -496,49 +580,66 @@ class Operand(Node):
   var: Optional['Var']
   expr: Optional['Expr']
 
-  def __str__(self):
-    for attr in ('cast', 'call', 'ref', 'num', 'var'):
-      if getattr(self, attr) is not None:
-        return str(getattr(self, attr))
-    # pylint: disable=useless-else-on-loop
-    else:
-      return parenthesize(self.expr)
+  def _get_held(self) -> Tuple[str, Any]:
+    """Returns the name and value of the attribute that is not None.
 
-  def _get_expr(self, lang: str) -> str:
-    for attr_name in ('cast', 'call', 'ref', 'num', 'var'):
-      attr = getattr(self, attr_name)
-      if attr is not None:
-        if hasattr(attr, '_get_expr'):
-          return attr._get_expr(lang)
-        return str(attr)
-    # pylint: disable=useless-else-on-loop
-    else:
-      assert self.expr is not None
-      return parenthesize(self.expr._get_expr(lang))
-
-  def _get_haoda_type(self):
+    Exactly one attribute is set. Its name is remembered so that later calls
+    need a single getattr instead of scanning all attributes; the scan is
+    repeated if that attribute has been cleared in a mutated copy.
+    """
+    attr = self.__dict__.get('_held_attr')
+    if attr is not None:
+      val = getattr(self, attr)
+      if val is not None:
+        return attr, val
     for attr in self.ATTRS:
       val = getattr(self, attr)
       if val is not None:
-        if hasattr(val, 'haoda_type'):
-          return val.haoda_type
-        if attr == 'num':
-          if 'u' in val.lower():
-            if 'll' in val.lower():
-              return ir.Type('uint64')
-            return ir.Type('uint32')
-          if 'll' in val.lower():
-            return ir.Type('int64')
-          if 'fl' in val.lower():
-            return ir.Type('double')
-          if 'f' in val.lower() or 'e' in val.lower():
-            return ir.Type('float')
-          if '.' in val:
-            return ir.Type('double')
-          return ir.Type('int32')
-        return None
+        self.__dict__['_held_attr'] = attr
+        return attr, val
     raise util.InternalError('undefined Operand')
 
+  def __str__(self):
+    attr, val = self._get_held()
+    if attr == 'expr':
+      return parenthesize(val)
+    return str(val)
+
+  def _get_expr(self, lang: str) -> str:
+    attr, val = self._get_held()
+    if attr == 'expr':
+      return parenthesize(val._get_expr(lang))
+    if hasattr(val, '_get_expr'):
+      return val._get_expr(lang)
+    return str(val)
+
+  def _get_haoda_type(self):
+    attr, val = self._get_held()
+    if hasattr(val, 'haoda_type'):
+      return val.haoda_type
+    if attr == 'num':
+      return _get_num_type(val)
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def _get_num_type(num: str) -> ir.Type:
+  """Returns the type of a numeric literal, parsed once per literal."""
+  lower = num.lower()
+  if 'u' in lower:
+    if 'll' in lower:
+      return ir.Type('uint64')
+    return ir.Type('uint32')
+  if 'll' in lower:
+    return ir.Type('int64')
+  if 'fl' in lower:
+    return ir.Type('double')
+  if 'f' in lower or 'e' in lower:
+    return ir.Type('float')
+  if '.' in num:
+    return ir.Type('double')
+  return ir.Type('int32')
+
 
 class Cast(Node):
   SCALAR_ATTRS = 'haoda_type', 'expr'
@@ -576,38 +677,29 @@ class Call(Node):
 
       if lang == 'c':
         fmt_str = 'std::{}({}, {})'
-
-        def variadic_to_binary_c(args: List[str]) -> str:
-          nargs = len(args)
-          if nargs == 1:
-            return args[0]
-          if nargs == 2:
-            return fmt_str.format(self.name, *args)
-          return fmt_str.format(self.name,
-                                variadic_to_binary_c(args[:nargs // 2]),
-                                variadic_to_binary_c(args[nargs // 2:]))
-
-        return variadic_to_binary_c([_.c_expr for _ in self.arg])
-
-      if lang == 'cl':
+        args = [_.c_expr for _ in self.arg]
+        is_float = [False] * len(args)  # C++ overloads std::min/max.
+      elif lang == 'cl':
         fmt_str = '{}({}, {})'
-
-        def variadic_to_binary_cl(args: Sequence[Node]) -> Tuple[str, bool]:
-          nargs = len(args)
-          func_name = self.name
-          if nargs == 1:
-            return args[0].cl_expr, args[0].haoda_type.is_float
-          if nargs == 2:
-            is_float = any(x.haoda_type.is_float for x in args)
-            if is_float:
-              func_name = f'f{func_name}'
-            return fmt_str.format(func_name,
-                                  *(x.cl_expr for x in args)), is_float
-          arg1, is_float1 = variadic_to_binary_cl(args[:nargs // 2])
-          arg2, is_float2 = variadic_to_binary_cl(args[nargs // 2:])
-          return fmt_str.format(func_name, arg1, arg2), is_float1 or is_float2
-
-        return variadic_to_binary_cl(self.arg)[0]
+        args = [_.cl_expr for _ in self.arg]
+        is_float = [_.haoda_type.is_float for _ in self.arg]
+
+      def variadic_to_binary(lo: int, hi: int) -> str:
+        """Reduces args[lo:hi] as a balanced tree of binary calls."""
+        nargs = hi - lo
+        if nargs == 1:
+          return args[lo]
+        func_name = self.name
+        if nargs == 2:
+          if is_float[lo] or is_float[lo + 1]:
+            func_name = f'f{func_name}'
+          return fmt_str.format(func_name, args[lo], args[lo + 1])
+        mid = lo + nargs // 2
+        return fmt_str.format(func_name, variadic_to_binary(lo, mid),
+                              variadic_to_binary(mid, hi))
+
+      if lang in {'c', 'cl'}:
+        return variadic_to_binary(0, len(args))
 
     if self.name == 'select':
       common_type = self.arg[1].haoda_type.common_type(self.arg[2].haoda_type)
@@ -628,10 +720,12 @@ class Var(Node):
   idx: Sequence[int]
 
   def __str__(self):
+    if not self.idx:  # scalar variables are the common case
+      return self.name
     return self.name + ''.join(map('[{}]'.format, self.idx))
 
   def _get_expr(self, lang: str) -> str:
-    return self.name + ''.join(map('[{}]'.format, self.idx))
+    return self.__str__()
 
 
 class FIFO(Node):
@@ -676,7 +770,14 @@ class FIFO(Node):
         '' if self.read_lat is None else ' ~%s' % self.read_lat)
 
   def __hash__(self):
-    return hash(tuple(getattr(self, _) for _ in self.IMMUTABLE_ATTRS))
+    # Same as hashing IMMUTABLE_ATTRS, spelled out and cached because FIFOs are
+    # the keys of Module.exprs and thus hashed very often.
+    try:
+      return self.__dict__['_hash']
+    except KeyError:
+      result = self.__dict__['_hash'] = hash(
+          (self.read_module, self.write_module))
+      return result
 
   def __eq__(self, other):
     return all(
@@ -740,15 +841,31 @@ class Module():
     return {(self, fifo.read_module): fifo for fifo in self.exprs}
 
   def fifo(self, dst_node):
-    return self.fifo_dict[(self, dst_node)]
+    """Return the output FIFO of this module that is read by dst_node.
+
+    Same as self.fifo_dict[(self, dst_node)] without building the dict. FIFOs
+    hash and compare by their write and read modules, so self.exprs holds at
+    most one FIFO to dst_node and the first match is the only one.
+
+    Raises:
+      KeyError: If dst_node does not read from this module.
+    """
+    for fifo in self.exprs:
+      if fifo.read_module == dst_node:
+        return fifo
+    raise KeyError((self, dst_node))
 
   def get_latency(self, dst_node):
     return self.fifo(dst_node).write_lat or 0
 
   def visit_loads(self, callback, args=None):
-    obj = copy.copy(self)
+    # Same as copy.copy(self) without the pickle protocol round trip. lets and
+    # exprs are replaced below, so the cached interfaces must not be inherited.
+    obj = type(self).__new__(type(self))
+    obj.__dict__.update(self.__dict__)
+    obj.__dict__.pop('_interfaces', None)
     obj.lets = tuple(_.visit(callback, args) for _ in self.lets)
-    obj.exprs = collections.OrderedDict()
+    obj.exprs = {}
     for fifo in self.exprs:
       obj.exprs[fifo] = self.exprs[fifo].visit(callback, args)
     return obj
@@ -769,28 +886,14 @@ class Module():
   def output_fifos(self) -> Tuple[str, ...]:
     return self._interfaces['output_fifos']
 
-  @cached_property.cached_property
+  @functools.cached_property
   def _interfaces(self):
-    # find dram reads
-    reads_in_lets = tuple(_.expr for _ in self.lets)
-    reads_in_exprs = tuple(self.exprs.values())
-    dram_reads = collections.OrderedDict()
-    for dram_ref in visitor.get_dram_refs(reads_in_lets + reads_in_exprs):
-      for bank in dram_ref.dram:
-        dram_reads[(dram_ref.var, bank)] = (dram_ref, bank)
-    dram_reads = tuple(dram_reads.values())
-
-    # find dram writes
-    writes_in_lets = tuple(
-        _.name for _ in self.lets if not isinstance(_.name, str))
-    dram_writes = collections.OrderedDict()
-    for dram_ref in visitor.get_dram_refs(writes_in_lets):
-      for bank in dram_ref.dram:
-        dram_writes[(dram_ref.var, bank)] = (dram_ref, bank)
-    dram_writes = tuple(dram_writes.values())
-
+    dram_read_refs, dram_write_refs, read_fifos = visitor.get_interface_refs(
+        self.lets, self.exprs.values())
+    dram_reads = _get_dram_banks(dram_read_refs)
+    dram_writes = _get_dram_banks(dram_write_refs)
     output_fifos = tuple(_.c_expr for _ in self.exprs)
-    input_fifos = tuple(_.c_expr for _ in visitor.get_read_fifo_set(self))
+    input_fifos = tuple(_.c_expr for _ in read_fifos)
 
     return {
         'dram_writes': dram_writes,
@@ -855,19 +958,24 @@ class Module():
     This method is a generator that traverses all descendant nodes in
     topological order.
     """
-    nodes = collections.OrderedDict()
-    for node in self.bfs_node_gen():
-      nodes[node] = len(node.parents)
-    while nodes:
-      for node in nodes:
-        if nodes[node] == 0:
-          yield node
-          for child in node.children:
-            nodes[child] -= 1
-          del nodes[node]
-          break
-      else:
-        return
+    # Kahn's algorithm. Among the nodes that are ready, the one first visited
+    # by BFS is always yielded first; a heap keyed by BFS order keeps that
+    # order without rescanning all nodes on each step.
+    order: Dict[Module, int] = {}
+    in_degrees: Dict[Module, int] = {}
+    ready: List[Tuple[int, Module]] = []
+    for idx, node in enumerate(self.bfs_node_gen()):
+      order[node] = idx
+      in_degrees[node] = len(node.parents)
+      if not node.parents:
+        ready.append((idx, node))
+    while ready:
+      _, node = heapq.heappop(ready)
+      yield node
+      for child in node.children:
+        in_degrees[child] -= 1
+        if in_degrees[child] == 0:
+          heapq.heappush(ready, (order[child], child))
 
   def bfs_edge_gen(self):
     """BFS over descendant edges.
@@ -907,7 +1015,16 @@ class Module():
     Returns:
       Set of descendant Module.
     """
-    return {self}.union(*map(Module.get_descendants, self.children))
+    # The set of seen nodes of any traversal is the result; no need to go
+    # through a generator and collect the nodes again.
+    seen_nodes = {self}
+    node_stack = [self]
+    while node_stack:
+      for child in node_stack.pop().children:
+        if child not in seen_nodes:
+          seen_nodes.add(child)
+          node_stack.append(child)
+    return seen_nodes
 
   def get_connections(self):
     """Get all descendant edges.
@@ -917,8 +1034,29 @@ class Module():
     Returns:
       Set of descendant (src Module, dst Module) tuple.
     """
-    return ({(self, child) for child in self.children
-            }.union(*map(Module.get_connections, self.children)))
+    return set(self.bfs_edge_gen())
+
+
+def _get_dram_banks(
+    dram_refs: Sequence['DRAMRef']) -> Tuple[Tuple['DRAMRef', int], ...]:
+  """Returns unique (DRAMRef, bank) pairs, keyed by the DRAM variable."""
+  dram_banks = {}
+  for dram_ref in dram_refs:
+    for bank in dram_ref.dram:
+      dram_banks[(dram_ref.var, bank)] = (dram_ref, bank)
+  return tuple(dram_banks.values())
+
+
+def _get_identifier(node: Node) -> str:
+  """Returns node.identifier if defined, or node.c_expr otherwise.
+
+  Unlike getattr(node, 'identifier', node.c_expr), c_expr is not generated if
+  it is not needed.
+  """
+  try:
+    return node.identifier
+  except AttributeError:
+    return node.c_expr
 
 
 class DelayedRef(Node):
@@ -952,7 +1090,7 @@ class DelayedRef(Node):
 
   @property
   def identifier(self) -> str:
-    ref = getattr(self.ref, 'identifier', self.ref.c_expr)
+    ref = _get_identifier(self.ref)
     return f'{ref}_delayed_{self.delay}'
 
   @property
@@ -1087,22 +1225,29 @@ class DRAMRef(Node):
   SCALAR_ATTRS = 'haoda_type', 'dram', 'var', 'offset'
 
   def __str__(self):
-    return 'dram<bank {} {}@{}>'.format(util.lst2str(self.dram), self.var,
-                                        self.offset)
+    dram = ', '.join(map(str, self.dram))
+    return f'dram<bank [{dram}] {self.var}@{self.offset}>'
 
   def __repr__(self):
     return str(self)
 
   def __hash__(self):
-    return hash((self.var, self.dram, self.offset))
+    # DRAMRefs are collected into keyed containers by the interface visitors,
+    # so cache the hash like Node.__hash__ does.
+    try:
+      return self.__dict__['_hash']
+    except KeyError:
+      result = self.__dict__['_hash'] = hash((self.var, self.dram, self.offset))
+      return result
 
   def __eq__(self, other):
+    if self is other:
+      return True
     if (self.haoda_type is not None and other.haoda_type is not None and
         self.haoda_type != other.haoda_type):
       return False
-    return all(
-        getattr(self, attr) == getattr(other, attr)
-        for attr in ('var', 'dram', 'offset'))
+    return ((self.var, self.dram, self.offset) ==
+            (other.var, other.dram, other.offset))
 
   def _get_expr(self, lang: str) -> str:
     return str(self)
@@ -1130,23 +1275,23 @@ class ModuleTrait(Node):
   """
   LINEAR_ATTRS = ('lets', 'exprs', 'template_types', 'template_ints')
 
+  # Modules sharing a trait have the same interfaces; compute them only once
+  # for each distinct trait that is alive.
+  _interfaces_dict = weakref.WeakKeyDictionary()
+
   def __init__(self, node):
 
     def mutate(obj, loads):
       if isinstance(obj, FIFO):
-        if loads:
-          if obj not in loads:
-            load_id = next(reversed(loads.values())).ref_id + 1
-          else:
-            return loads[obj]
-        else:
-          load_id = 0
-        fifo_ref = FIFORef(fifo=obj, lat=obj.read_lat, ref_id=load_id)
+        if obj in loads:
+          return loads[obj]
+        # Loads are numbered consecutively from 0 in the order of appearance.
+        fifo_ref = FIFORef(fifo=obj, lat=obj.read_lat, ref_id=len(loads))
         loads[obj] = fifo_ref
         return fifo_ref
       return obj
 
-    loads = collections.OrderedDict()
+    loads = {}
     node = node.visit_loads(mutate, loads)
     self.loads = tuple(loads.values())
     super().__init__(lets=tuple(node.lets),
@@ -1176,28 +1321,20 @@ class ModuleTrait(Node):
   def output_fifos(self):
     return self._interfaces['output_fifos']
 
-  @cached_property.cached_property
+  @functools.cached_property
   def _interfaces(self):
-    # find dram reads
-    reads_in_lets = tuple(_.expr for _ in self.lets)
-    reads_in_exprs = tuple(self.exprs)
-    dram_reads = collections.OrderedDict()
-    for dram_ref in visitor.get_dram_refs(reads_in_lets + reads_in_exprs):
-      for bank in dram_ref.dram:
-        dram_reads[(dram_ref.var, bank)] = (dram_ref, bank)
-    dram_reads = tuple(dram_reads.values())
-
-    # find dram writes
-    writes_in_lets = tuple(
-        _.name for _ in self.lets if not isinstance(_.name, str))
-    dram_writes = collections.OrderedDict()
-    for dram_ref in visitor.get_dram_refs(writes_in_lets):
-      for bank in dram_ref.dram:
-        dram_writes[(dram_ref.var, bank)] = (dram_ref, bank)
-    dram_writes = tuple(dram_writes.values())
-
-    output_fifos = tuple('{}{}'.format(FIFORef.ST_PREFIX, idx)
-                         for idx, expr in enumerate(self.exprs))
+    interfaces = ModuleTrait._interfaces_dict.get(self)
+    if interfaces is None:
+      interfaces = ModuleTrait._interfaces_dict[self] = self._get_interfaces()
+    return interfaces
+
+  def _get_interfaces(self):
+    dram_read_refs, dram_write_refs, _ = visitor.get_interface_refs(
+        self.lets, self.exprs)
+    dram_reads = _get_dram_banks(dram_read_refs)
+    dram_writes = _get_dram_banks(dram_write_refs)
+    output_fifos = tuple(
+        f'{FIFORef.ST_PREFIX}{idx}' for idx in range(len(self.exprs)))
     input_fifos = tuple(_.ld_name for _ in self.loads)
 
     return {
@@ -1231,9 +1368,14 @@ class Pack(Node):
 
   @property
   def identifier(self) -> str:
-    long_name = '_'.join(getattr(x, 'identifier', x.c_expr) for x in self.exprs)
+    try:
+      return self.__dict__['_cached_identifier']
+    except KeyError:
+      pass
+    long_name = '_'.join(map(_get_identifier, self.exprs))
     short_name = Pack._name_dict.setdefault(long_name, len(Pack._name_dict))
-    return 'pack_%d' % short_name
+    result = self.__dict__['_cached_identifier'] = 'pack_%d' % short_name
+    return result
 
 
 class Unpack(Node):
@@ -1254,7 +1396,7 @@ class Unpack(Node):
 
   @property
   def identifier(self) -> str:
-    expr = getattr(self.expr, 'identifier', self.expr.c_expr)
+    expr = _get_identifier(self.expr)
     return f'{expr}_val_{self.idx}'
 
 
@@ -1272,18 +1414,19 @@ def is_const(node: Node) -> bool:
   return False
 
 
+_NON_OCTAL_PREFIXES = frozenset(('', 'x', 'X', 'b', 'B', 'o', 'O'))
+
+
 def str2int(s, none_val=None):
   if s is None:
     return none_val
-  while s[-1] in 'UuLl':
-    s = s[:-1]
-  if s[0:2] == '0x' or s[0:2] == '0X':
-    return int(s, 16)
-  if s[0:2] == '0b' or s[0:2] == '0B':
-    return int(s, 2)
-  if s[0] == '0':
-    return int(s, 8)
-  return int(s)
+  s = s.rstrip('UuLl')
+  # int(s, 0) handles the 0x/0b/0o prefixes, but C octals have only a 0.
+  sign = s[0] if s[0] in '+-' else ''
+  digits = s[len(sign):]
+  if digits[0] == '0' and digits[1:2] not in _NON_OCTAL_PREFIXES:
+    s = f'{sign}0o{digits[1:]}'
+  return int(s, 0)
 
 
 def parenthesize(expr) -> str:
@@ -1343,7 +1486,7 @@ def get_min_val(node) -> int:
 
 
 REDUCTION_OPS = {'+': AddSub, '*': MulDiv}
-REDUCTION_FUNCS = {'min', 'max'}
+REDUCTION_FUNCS = frozenset(('min', 'max'))
 
 
 def to_reduction(node: Node) -> Optional[Tuple[str, Tuple[Node, ...]]]:
@@ -1358,9 +1501,11 @@ def to_reduction(node: Node) -> Optional[Tuple[str, Tuple[Node, ...]]]:
     operands is a tuple of operands as Nodes.
   """
   if isinstance(node, BinaryOp):
-    operator = getattr(node, 'operator')
-    if len(set(operator)) == 1 and operator[0] in REDUCTION_OPS:
-      return operator[0], getattr(node, 'operand')
+    operator = node.operator
+    # All operators are the same reduction operator.
+    if (operator and operator[0] in REDUCTION_OPS and
+        operator.count(operator[0]) == len(operator)):
+      return operator[0], node.operand
   elif isinstance(node, Call):
     operator = getattr(node, 'name')
     if operator in REDUCTION_FUNCS:
@@ -1384,6 +1529,6 @@ def from_reduction(operator: str, operands: Tuple[Node, ...]) -> Node:
   if operator in REDUCTION_OPS:
     return REDUCTION_OPS[operator](operator=(operator,) * (len(operands) - 1),
                                    operand=operands)
-  if operator in {'min', 'max'}:
+  if operator in REDUCTION_FUNCS:
     return Call(name=operator, arg=operands)
   raise ValueError('%s is not a reduction operator' % operator)
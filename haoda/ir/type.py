@@ -1,6 +1,7 @@
-from typing import Any, Iterable, Iterator, Optional
+import re
+from typing import Any, Dict, Iterable, Iterator, Optional
 
-from cached_property import cached_property
+from functools import cached_property, lru_cache
 
 import haoda.util
 
@@ -24,22 +25,45 @@ HAODA_TYPE_TO_CL_TYPE = {
 
 
 class Type:
-
-  def __init__(self, val: Optional[str]):
+  # Types are immutable and programs use only a few distinct names, so each
+  # name is represented by a single shared instance.
+  _instances: Dict[Optional[str], 'Type'] = {}
+
+  def __new__(cls, val: Optional[str]):
+    if cls is not Type:
+      return super().__new__(cls)
+    try:
+      return Type._instances[val]
+    except (KeyError, TypeError):  # TypeError if val is not hashable
+      pass
     if not isinstance(val, (str, type(None))):
       raise TypeError('Type can only be constructed from str or NoneType, '
                       'got ' + type(val).__name__)
-    self._val = val
+    obj = super().__new__(cls)
+    obj._val = val
+    # Needed by every comparison and cannot fail, unlike the other properties
+    # that are computed on first use.
+    obj.is_float = _is_float(val)
+    obj.is_fixed = _is_fixed(val)
+    Type._instances[val] = obj
+    return obj
 
   def __str__(self) -> str:
     return str(self._val)
 
+  def __reduce__(self):
+    # Go through the constructor so that copies and unpickled objects are the
+    # shared instances rather than new ones.
+    return type(self), (self._val,)
+
   def __hash__(self) -> int:
     if self._val is None:
       return hash(None)
     return self.width_in_bits
 
   def __eq__(self, other: Any) -> bool:
+    if self is other:
+      return True
     if isinstance(other, str):
       other = Type(other)
     elif not isinstance(other, Type):
@@ -54,38 +78,11 @@ class Type:
 
   @cached_property
   def c_type(self) -> Optional[str]:
-    if self._val in {
-        'uint8', 'uint16', 'uint32', 'uint64', 'int8', 'int16', 'int32', 'int64'
-    }:
-      return self._val + '_t'
-    if self._val is None:
-      return None
-    if self._val == 'float32':
-      return 'float'
-    if self._val == 'float64':
-      return 'double'
-    for token in ('int', 'uint'):
-      if self._val.startswith(token):
-        bits = self._val.replace(token, '').split('_')
-        if len(bits) > 1:
-          assert len(bits) == 2
-          return 'ap_{}<{}, {}>'.format(token.replace('int', 'fixed'), *bits)
-        assert len(bits) == 1
-        return 'ap_{}<{}>'.format(token, *bits)
-    return self._val
+    return _get_c_type(self._val)
 
   @cached_property
   def width_in_bits(self) -> int:
-    if isinstance(self._val, str):
-      if self._val in TYPE_WIDTH:
-        return TYPE_WIDTH[self._val]
-      for prefix in 'uint', 'int', 'float':
-        if self._val.startswith(prefix):
-          return int(self._val.lstrip(prefix).split('_')[0])
-    elif hasattr(self._val, 'haoda_type'):
-      assert self._val is not None
-      return self._val.haoda_type.width_in_bits
-    raise haoda.util.InternalError('unknown haoda type: %s' % self._val)
+    return _get_width_in_bits(self._val)
 
   @cached_property
   def width_in_bytes(self) -> int:
@@ -116,23 +113,6 @@ class Type:
       return other
     return self
 
-  @cached_property
-  def is_float(self) -> bool:
-    if self._val is None:
-      return False
-    return self._val in {'half', 'double'} or self._val.startswith('float')
-
-  @cached_property
-  def is_fixed(self) -> bool:
-    if self._val is None:
-      return False
-    for token in ('int', 'uint'):
-      if self._val.startswith(token):
-        bits = self._val.replace(token, '').split('_')
-        if len(bits) > 1:
-          return True
-    return False
-
   @cached_property
   def cl_type(self) -> Optional[str]:
     if self._val is None:
@@ -143,14 +123,79 @@ class Type:
     return self._val + '_t'
 
   def get_cl_vec_type(self, burst_width: int) -> str:
-    scalar_width = self.width_in_bits
-    assert (burst_width % scalar_width == 0
-           ), "burst width must be a multiple of width of the scalar type"
-    assert (self._val in HAODA_TYPE_TO_CL_TYPE), "scalar type not supported"
+    return _get_cl_vec_type(self._val, burst_width)
+
+
+# Types are parsed from their names. Programs use only a handful of distinct
+# names but create many Type instances, so the parsing is cached by name
+# rather than per instance.
+
+
+@lru_cache(maxsize=None)
+def _get_c_type(val: Optional[str]) -> Optional[str]:
+  if val in {
+      'uint8', 'uint16', 'uint32', 'uint64', 'int8', 'int16', 'int32', 'int64'
+  }:
+    return val + '_t'
+  if val is None:
+    return None
+  if val == 'float32':
+    return 'float'
+  if val == 'float64':
+    return 'double'
+  for token in ('int', 'uint'):
+    if val.startswith(token):
+      bits = val.replace(token, '').split('_')
+      if len(bits) > 1:
+        assert len(bits) == 2
+        return 'ap_{}<{}, {}>'.format(token.replace('int', 'fixed'), *bits)
+      assert len(bits) == 1
+      return 'ap_{}<{}>'.format(token, *bits)
+  return val
+
+
+_WIDTH_PATTERN = re.compile(r'(?:u?int|float)(\d+)')
+
+
+@lru_cache(maxsize=None)
+def _get_width_in_bits(val: Optional[str]) -> int:
+  if isinstance(val, str):
+    if val in TYPE_WIDTH:
+      return TYPE_WIDTH[val]
+    match = _WIDTH_PATTERN.match(val)
+    if match is not None:
+      return int(match.group(1))
+  raise haoda.util.InternalError('unknown haoda type: %s' % val)
+
+
+@lru_cache(maxsize=None)
+def _is_float(val: Optional[str]) -> bool:
+  if val is None:
+    return False
+  return val in {'half', 'double'} or val.startswith('float')
+
+
+_FIXED_PATTERN = re.compile(r'u?int\d+_\d+')
 
-    if burst_width == scalar_width:
-      return HAODA_TYPE_TO_CL_TYPE[self._val]
-    return HAODA_TYPE_TO_CL_TYPE[self._val] + str(burst_width // scalar_width)
+
+@lru_cache(maxsize=None)
+def _is_fixed(val: Optional[str]) -> bool:
+  if val is None:
+    return False
+  return _FIXED_PATTERN.fullmatch(val) is not None
+
+
+@lru_cache(maxsize=None)
+def _get_cl_vec_type(val: Optional[str], burst_width: int) -> str:
+  scalar_width = _get_width_in_bits(val)
+  assert (burst_width % scalar_width == 0
+         ), "burst width must be a multiple of width of the scalar type"
+  cl_type = HAODA_TYPE_TO_CL_TYPE.get(val)
+  assert cl_type is not None, "scalar type not supported"
+
+  if burst_width == scalar_width:
+    return cl_type
+  return cl_type + str(burst_width // scalar_width)
 
 
 class TupleType(Type):
@@ -161,6 +206,9 @@ class TupleType(Type):
   def __str__(self) -> str:
     return 'haoda_%s_tuple' % '_'.join(map(str, self._types))
 
+  def __reduce__(self):
+    return type(self), (self._types,)
+
   def __hash__(self) -> int:
     return hash(self._types)
 
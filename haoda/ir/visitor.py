@@ -21,7 +21,7 @@ def get_read_fifo_set(module):
       args[obj] = None
     return obj
 
-  fifo_loads = collections.OrderedDict()
+  fifo_loads = {}
   if isinstance(module, ir.Module):
     module.visit_loads(visitor, fifo_loads)
   else:
@@ -29,6 +29,39 @@ def get_read_fifo_set(module):
   return tuple(fifo_loads)
 
 
+def get_interface_refs(lets, exprs):
+  """Get DRAM and FIFO references of a module's lets and exprs in one walk.
+
+  Args:
+    lets: An Iterable of haoda.ir.Let objects.
+    exprs: An Iterable of haoda.ir.Node objects.
+
+  Returns:
+    A tuple of (dram_reads, dram_writes, read_fifos). dram_reads are the
+    DRAMRefs in the expressions of lets and in exprs; dram_writes are the
+    DRAMRefs in the names of lets; read_fifos are all FIFOs, each appearing
+    only once.
+  """
+  dram_reads = []
+  dram_writes = []
+  read_fifos = {}
+
+  def visitor(node, dram_refs):
+    if isinstance(node, ir.DRAMRef):
+      dram_refs.append(node)
+    elif isinstance(node, ir.FIFO):
+      read_fifos[node] = None
+    return node
+
+  for let in lets:
+    if isinstance(let.name, ir.Node):
+      let.name.visit(visitor, dram_writes)
+    let.expr.visit(visitor, dram_reads)
+  for expr in exprs:
+    expr.visit(visitor, dram_reads)
+  return tuple(dram_reads), tuple(dram_writes), tuple(read_fifos)
+
+
 def get_instances_of(node_or_iterable, class_or_tuple):
   """Get all ir.Node references of specific classes as a tuple.
 
@@ -49,15 +82,19 @@ def get_instances_of(node_or_iterable, class_or_tuple):
       instances.append(node)
     return node
 
-  if isinstance(node_or_iterable, collections.abc.Iterable):
-    return sum(
-        (get_instances_of(node, class_or_tuple) for node in node_or_iterable),
-        ())
+  # Collect into a single list; concatenating a tuple per node would be
+  # quadratic in the number of nodes.
+  def collect(node_or_iterable):
+    if isinstance(node_or_iterable, collections.abc.Iterable):
+      for node in node_or_iterable:
+        collect(node)
+    elif isinstance(node_or_iterable, ir.Node):
+      node_or_iterable.visit(visitor, instances)
+    else:
+      raise TypeError('argument is not an IR node or a sequence')
+
   instances = []
-  if isinstance(node_or_iterable, ir.Node):
-    node_or_iterable.visit(visitor, instances)
-  else:
-    raise TypeError('argument is not an IR node or a sequence')
+  collect(node_or_iterable)
   return tuple(instances)
 
 
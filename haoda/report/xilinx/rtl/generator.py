@@ -104,15 +104,8 @@ class ReportDirUtil(backend.Vivado):
     }
     self.job_server_fd = util.get_job_server_fd(())
     if self.job_server_fd is not None:
-      new_fd = os.open('/proc/self/fd/%d' % self.job_server_fd,
-                       os.O_RDWR | os.O_NONBLOCK)
-      self.num_jobs = 1  # maximum supported by Vivado is 8
-      try:
-        for i in range(7):
-          self.num_jobs += len(os.read(new_fd, 1))
-      except BlockingIOError as e:
-        pass
-      os.close(new_fd)
+      self.num_jobs = 1 + len(_read_job_server_tokens(
+          self.job_server_fd, backend.VIVADO_MAX_THREADS - 1))
       kwargs['set_parallel'] = 'set_param general.maxThreads %d' % self.num_jobs
     super().__init__(REPORT_UTIL_COMMANDS.format(**kwargs))
 
@@ -122,6 +115,31 @@ class ReportDirUtil(backend.Vivado):
       os.write(self.job_server_fd, b'x' * (self.num_jobs - 1))
 
 
+def _read_job_server_tokens(job_server_fd: int, max_tokens: int) -> bytes:
+  """Take up to max_tokens available tokens from the job server, nonblocking.
+
+  O_NONBLOCK is shared by every process holding the same open file
+  description, so the pipe is reopened via /proc where available to keep the
+  job server itself blocking; otherwise the fd is switched temporarily.
+  """
+  try:
+    fd = os.open('/proc/self/fd/%d' % job_server_fd, os.O_RDWR | os.O_NONBLOCK)
+    blocking = None
+  except FileNotFoundError:
+    fd = job_server_fd
+    blocking = os.get_blocking(fd)
+    os.set_blocking(fd, False)
+  try:
+    return os.read(fd, max_tokens)
+  except BlockingIOError:
+    return b''
+  finally:
+    if blocking is None:
+      os.close(fd)
+    else:
+      os.set_blocking(fd, blocking)
+
+
 class ReportXoUtil(ReportDirUtil):
   """Run synthesis and generate resource utilization report.
 
@@ -163,20 +181,40 @@ class ReportXoUtil(ReportDirUtil):
     self.rpt_file_name = os.path.join(self.tmpdir.name, 'post_synth_util.rpt')
     with zipfile.ZipFile(xo_file) as xo_zip:
       with xo_zip.open('xo.xml') as xo_xml:
-        kernel = ET.parse(xo_xml).find('./Kernels/Kernel')
+        # Same as ET.parse(xo_xml).find('./Kernels/Kernel'), but stop parsing
+        # at the first kernel instead of building the whole tree.
+        kernel = None
+        path = []
+        for event, elem in ET.iterparse(xo_xml, events=('start', 'end')):
+          if event == 'start':
+            path.append(elem.tag)
+            if path[1:] == ['Kernels', 'Kernel']:
+              kernel = elem
+              break
+          else:
+            path.pop()
+            elem.clear()
         if kernel is None:
           raise util.InputError('cannot parse XO file')
         ip_dir = kernel.attrib['IP']
         kernel_name = kernel.attrib['Name']
-      hdl_dir_prefix = ip_dir + '/src'
-      if all(not x.startswith(hdl_dir_prefix) for x in xo_zip.namelist()):
-        hdl_dir_prefix = ip_dir + '/hdl/verilog'
+      # HDL files are under {ip_dir}/src if there are any, otherwise under
+      # {ip_dir}/hdl/verilog; find both in a single pass over the members.
+      src_prefix = ip_dir + '/src'
+      verilog_prefix = ip_dir + '/hdl/verilog'
+      src_members = []
+      verilog_members = []
+      for name in xo_zip.namelist():
+        if name.startswith(src_prefix):
+          src_members.append(name)
+        elif name.startswith(verilog_prefix):
+          verilog_members.append(name)
+      if src_members:
+        hdl_dir_prefix, hdl_members = src_prefix, src_members
+      else:
+        hdl_dir_prefix, hdl_members = verilog_prefix, verilog_members
       hdl_dir = os.path.join(self.tmpdir.name, hdl_dir_prefix)
-      xo_zip.extractall(path=self.tmpdir.name,
-                        members=[
-                            name for name in xo_zip.namelist()
-                            if name.startswith(hdl_dir_prefix)
-                        ])
+      xo_zip.extractall(path=self.tmpdir.name, members=hdl_members)
 
     if not top_name:
       top_name = kernel_name
@@ -201,17 +239,22 @@ class ReportXoUtil(ReportDirUtil):
 
 
 RTL_HLS_INFO_REGEX = r'\(\* CORE_GENERATION_INFO\s*=\s*".*,\{(.*)\}" \*\)'
+_RTL_HLS_INFO_PATTERN = re.compile(RTL_HLS_INFO_REGEX)
 
 
 class RtlHlsInfo:
 
   def __init__(self, rtl_file: TextIO):
-    match = re.search(RTL_HLS_INFO_REGEX, rtl_file.read())
-    if match is None:
+    # The attribute is on a single line near the top of the module; scan line
+    # by line and stop there instead of reading the whole file.
+    for line in rtl_file:
+      match = _RTL_HLS_INFO_PATTERN.search(line)
+      if match is not None:
+        break
+    else:
       raise util.InputError('cannot parse RTL file')
-    for item in match.group(1).split(','):
-      key, value = item.split('=')
-      setattr(self, key, value)
+    self.__dict__.update(
+        item.split('=', 1) for item in match.group(1).split(','))
 
   def __getitem__(self, key: str) -> str:
-    return getattr(self, key)
+    return self.__dict__[key]
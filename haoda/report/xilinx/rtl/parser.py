@@ -17,6 +17,7 @@ _logger = logging.getLogger().getChild(__name__)
 
 class HierarchicalUtilization:
   """Semantic-agnostic hierarchical utilization."""
+  __slots__ = ('device', 'parent', 'children', 'instance', 'schema', 'items')
   device: str
   parent: Optional['HierarchicalUtilization']
   children: List['HierarchicalUtilization']
@@ -77,11 +78,13 @@ def parse_hierarchical_utilization_report(
 
   for line in rpt_file:
     line = line.strip()
-    items = line.split()
-    if len(items) == 4 and items[:3] == ['|', 'Device', ':']:
-      device = items[3]
-      continue
-    if set(line) == {'+', '-'}:
+    if line.startswith('| Device'):
+      items = line.split()
+      if len(items) == 4 and items[:3] == ['|', 'Device', ':']:
+        device = items[3]
+        continue
+    # Table separators are made of both '+' and '-' and nothing else.
+    elif line.startswith('+') and '-' in line and not line.lstrip('+-'):
       if parse_state == ParseState.PROLOG:
         parse_state = ParseState.HEADER
       elif parse_state == ParseState.HEADER:
@@ -95,13 +98,13 @@ def parse_hierarchical_utilization_report(
     if parse_state == ParseState.HEADER:
       instance, items = get_items(line)
       assert instance.lstrip() == 'Instance'
-      schema = {x.lstrip(): i for i, x in enumerate(items)}
+      schema = {x: i for i, x in enumerate(items)}
 
     elif parse_state == ParseState.BODY:
-      instance, items = get_items(line)
-      while (len(instance) - len(instance.lstrip(' '))) // 2 < len(stack):
-        stack.pop()
-      instance = instance.lstrip()
+      indented_instance, items = get_items(line)
+      instance = indented_instance.lstrip()
+      depth = (len(indented_instance) - len(instance)) // 2
+      del stack[depth:]
       parent = stack[-1] if stack else None
       stack.append(
           HierarchicalUtilization(device, instance, schema, items, parent))
@@ -1,4 +1,5 @@
 import contextlib
+import functools
 import logging
 import os
 import signal
@@ -44,6 +45,8 @@ class MetaFmt:
 
 class Printer:
   """A text-based code printer."""
+  __slots__ = ('_out', '_indent', '_assign', '_comments', '_tab', '_indent_str',
+               'eol')
 
   def __init__(self, out: TextIO):
     self._out = out
@@ -51,31 +54,37 @@ class Printer:
     self._assign = 0
     self._comments = []  # type: List[str]
     self._tab = 2
+    self._indent_str = ''
     self.eol = '\n'
 
   def println(self, line: str = '', indent: int = -1) -> None:
-    if indent < 0:
-      indent = self._indent
     if line:
-      self._out.write((' ' * indent * self._tab) + line + self.eol)
+      if indent < 0:
+        prefix = self._indent_str
+      else:
+        prefix = ' ' * (indent * self._tab)
+      self._out.write(prefix + line + self.eol)
     else:
       self._out.write(self.eol)
 
   def printlns(self, lines: Union[Iterable[str], str], *extra_lines: str,
                **kwargs) -> None:
+    println = self.println
     if isinstance(lines, str):
-      self.println(lines, **kwargs)
+      println(lines, **kwargs)
     else:
       for line in lines:
-        self.println(line, **kwargs)
+        println(line, **kwargs)
     for line in extra_lines:
-      self.println(line, **kwargs)
+      println(line, **kwargs)
 
   def do_indent(self) -> None:
     self._indent += 1
+    self._indent_str = ' ' * (self._indent * self._tab)
 
   def un_indent(self) -> None:
     self._indent -= 1
+    self._indent_str = ' ' * (self._indent * self._tab)
 
   def do_scope(self, comment: str = '') -> None:
     self.println('{')
@@ -86,16 +95,17 @@ class Printer:
     self.un_indent()
     popped_comment = self._comments.pop()
     if comment:
-      self.println('}%s // %s' % (suffix, comment))
+      self.println(f'}}{suffix} // {comment}')
     else:
       if popped_comment:
-        self.println('}%s // %s' % (suffix, popped_comment))
+        self.println(f'}}{suffix} // {popped_comment}')
       else:
-        self.println('}%s' % suffix)
+        self.println('}' + suffix)
 
 
 class CppPrinter(Printer):
   """A text-based C printer."""
+  __slots__ = ()
 
   def new_var(self) -> str:
     self._assign += 1
@@ -105,7 +115,7 @@ class CppPrinter(Printer):
     return 'assign_%d' % (self._assign + offset)
 
   def println(self, line: str = '', indent: int = -1) -> None:
-    if line.startswith('#'):
+    if line and line[0] == '#':
       indent = 0
     super().println(line, indent)
 
@@ -114,18 +124,26 @@ class CppPrinter(Printer):
                  params: Iterable[str],
                  suffix: str = '',
                  align: int = 80) -> None:
-    lines = [name + '(']
+    # Collect the pieces of each line and join them once, instead of growing
+    # the last line by concatenation for every parameter.
+    parts = [[name + '(']]
+    # width is the current line length including indentation; continuation
+    # lines are indented one level deeper than the first line.
+    wrap_indent = (self._indent + 1) * self._tab
+    width = self._indent * self._tab + len(name) + 1
     for param in params:
-      if ((self._indent + min(1,
-                              len(lines) - 1)) * self._tab + len(lines[-1]) +
-          len(param + ', ')) > align:
-        lines.append(param + ', ')
+      param_width = len(param) + 2  # for the trailing ', '
+      if width + param_width > align:
+        parts.append([param, ', '])
+        width = wrap_indent + param_width
       else:
-        lines[-1] += param + ', '
-    if lines[-1][-2:] == ', ':
-      lines[-1] = lines[-1][:-2] + ')' + suffix
-    if len(lines) == 1:  # params is empty
-      lines[-1] += ')'
+        parts[-1] += param, ', '
+        width += param_width
+    if len(parts[-1]) > 1:  # replace the trailing ', ' of the last param
+      parts[-1][-1] = ')' + suffix
+    else:  # params is empty
+      parts[-1].append(')' + suffix)
+    lines = [''.join(line_parts) for line_parts in parts]
     line = lines.pop(0)
     self.println(line)
     if lines:
@@ -190,23 +208,24 @@ class CppPrinter(Printer):
 
 
 def print_define(printer: CppPrinter, var: str, val: str) -> None:
-  printer.println('#ifndef %s' % var)
-  printer.println('#define %s %s' % (var, val))
-  printer.println('#endif  //%s' % var)
+  printer.println(f'#ifndef {var}')
+  printer.println(f'#define {var} {val}')
+  printer.println(f'#endif  //{var}')
 
 
 def print_guard(printer: CppPrinter, var: str, val: str) -> None:
-  printer.println('#ifdef %s' % var)
-  printer.println('#if %s != %s' % (var, val))
-  printer.println('#error %s != %s' % (var, val))
-  printer.println('#endif  //%s != %s' % (var, val))
-  printer.println('#endif  //%s' % var)
+  printer.println(f'#ifdef {var}')
+  printer.println(f'#if {var} != {val}')
+  printer.println(f'#error {var} != {val}')
+  printer.println(f'#endif  //{var} != {val}')
+  printer.println(f'#endif  //{var}')
 
 
 def get_haoda_type(c_type: str) -> str:
-  return c_type[:-2] if c_type[-2:] == '_t' else c_type
+  return c_type[:-2] if c_type.endswith('_t') else c_type
 
 
+@functools.lru_cache(maxsize=None)
 def get_suitable_int_type(upper: int, lower: int = 0) -> str:
   """Returns the suitable integer type with the least bits.
 
@@ -229,31 +248,32 @@ def get_suitable_int_type(upper: int, lower: int = 0) -> str:
 
 
 def idx2str(idx: Iterable[Any]) -> str:
-  return '(%s)' % ', '.join(map(str, idx))
+  return '(' + ', '.join([str(x) for x in idx]) + ')'
 
 
 def lst2str(idx: Iterable[Any]) -> str:
-  return '[%s]' % ', '.join(map(str, idx))
+  return '[' + ', '.join([str(x) for x in idx]) + ']'
 
 
 def add_inv(idx: Iterable[int]) -> Tuple[int, ...]:
-  return tuple(-x for x in idx)
+  return tuple([-x for x in idx])
 
 
 def get_module_name(module_id: int) -> str:
-  return 'module_%d' % module_id
+  return f'module_{module_id:d}'
 
 
 def get_func_name(module_id: int) -> str:
-  return 'Module%dFunc' % module_id
+  return f'Module{module_id:d}Func'
 
 
-get_port_name = lambda name, bank: 'bank_{}_{}'.format(bank, name)
-get_port_buf_name = lambda name, bank: 'bank_{}_{}_buf'.format(bank, name)
+get_port_name = lambda name, bank: f'bank_{bank}_{name}'
+get_port_buf_name = lambda name, bank: f'bank_{bank}_{name}_buf'
 
 
 def get_bundle_name(name: str, bank: int):
-  return '{}_bank_{}'.format(name.replace('<', '_').replace('>', ''), bank)
+  name = name.replace('<', '_').replace('>', '')
+  return f'{name}_bank_{bank}'
 
 
 def pause_for_debugging() -> None:
@@ -273,8 +293,10 @@ def timeout(seconds: int = 1, error_message: str = 'Timeout'):
 
   signal.signal(signal.SIGALRM, handler)
   signal.alarm(seconds)
-  yield
-  signal.alarm(0)
+  try:
+    yield
+  finally:
+    signal.alarm(0)
 
 
 def get_job_server_fd(
@@ -309,7 +331,7 @@ def acquire_job_slot(job_server_fd: Union[int, Tuple[()],
     The job server file descriptor, or None.
   """
   job_server_fd = get_job_server_fd(job_server_fd)
-  if job_server_fd is not None and len(os.read(job_server_fd, 1)) != 1:
+  if job_server_fd is not None and not os.read(job_server_fd, 1):
     job_server_fd = None
   return job_server_fd
 
@@ -337,8 +359,10 @@ def define_alias_flags(module: str) -> None:
   names = {x.name for x in flags.FLAGS.get_flags_for_module(module)}
   aliases = set()
   for name in names:
+    if '-' not in name:
+      continue
     alias = name.replace('-', '_')
-    if alias != name and alias not in names and alias not in aliases:
+    if alias not in names and alias not in aliases:
       flags.DEFINE_alias(alias, name, module_name=module)
       aliases.add(alias)
 
@@ -30,8 +30,6 @@ setup(
         'License :: OSI Approved :: MIT License',
         'Programming Language :: Python :: 3 :: Only',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.6',
-        'Programming Language :: Python :: 3.7',
         'Programming Language :: Python :: 3.8',
         'Topic :: System :: Hardware',
     ],
@@ -39,9 +37,8 @@ setup(
         'tests.*',
         'tests',
     )),
-    python_requires='>=3.6',
+    python_requires='>=3.8',
     install_requires=[
         'absl-py',
-        'cached_property',
     ],
 )
@@ -0,0 +1,215 @@
+import io
+import os
+import tempfile
+import unittest
+import unittest.mock
+import zipfile
+
+from haoda.backend import xilinx
+
+HPFM = '''<?xml version="1.0" encoding="UTF-8"?>
+<xd:repository xmlns:xd="http://www.xilinx.com/xd">
+  <xd:component xd:name="xilinx_u250_xdma_201830_2">
+    <xd:platformInfo>
+      <xd:deviceInfo xd:name="xcu250-figd2104-2L-e"/>
+      <xd:systemClocks>
+        <xd:clock xd:id="0" xd:period="3.333333"/>
+      </xd:systemClocks>
+    </xd:platformInfo>
+  </xd:component>
+</xd:repository>
+'''
+
+
+class TestDeviceInfo(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.TemporaryDirectory()
+    self.platform = os.path.join(self.tmpdir.name, 'xilinx_u250_xdma_201830_2')
+    os.makedirs(os.path.join(self.platform, 'hw'))
+    with zipfile.ZipFile(
+        os.path.join(self.platform, 'hw', 'xilinx_u250_xdma_201830_2.xsa'),
+        'w') as xsa:
+      xsa.writestr('xilinx_u250_xdma_201830_2.hpfm', HPFM)
+
+  def tearDown(self):
+    self.tmpdir.cleanup()
+
+  def test_get_device_info(self):
+    device_info = xilinx.get_device_info(self.platform)
+    self.assertEqual(device_info['clock_period'], '3.333333')
+    self.assertEqual(device_info['part_num'], 'xcu250-figd2104-2L-e')
+
+  def test_get_device_info_only_reads_component_platform_info(self):
+    # platformInfo elsewhere than ./xd:component/xd:platformInfo is ignored.
+    decoy = ('<xd:platformInfo><xd:deviceInfo xd:name="decoy"/>'
+             '</xd:platformInfo>')
+    hpfm = HPFM.replace('<xd:component', f'{decoy}<xd:component').replace(
+        '<xd:platformInfo>', f'<xd:extra>{decoy}</xd:extra><xd:platformInfo>',
+        2)
+    with zipfile.ZipFile(
+        os.path.join(self.platform, 'hw', 'xilinx_u250_xdma_201830_2.xsa'),
+        'w') as xsa:
+      xsa.writestr('xilinx_u250_xdma_201830_2.hpfm', hpfm)
+    device_info = xilinx.get_device_info(self.platform)
+    self.assertEqual(device_info['part_num'], 'xcu250-figd2104-2L-e')
+
+  def test_get_device_info_is_cached(self):
+    device_info = xilinx.get_device_info(self.platform)
+    device_info['part_num'] = ''
+    with unittest.mock.patch.object(zipfile, 'ZipFile') as zip_file:
+      self.assertEqual(xilinx.get_device_info(self.platform + os.sep),
+                       {'clock_period': '3.333333',
+                        'part_num': 'xcu250-figd2104-2L-e'})
+    zip_file.assert_not_called()
+
+  def test_get_device_info_batch(self):
+    device_infos = xilinx.get_device_info_batch(
+        (self.platform, self.platform + os.sep), max_workers=2)
+    self.assertEqual(len(device_infos), 2)
+    for device_info in device_infos.values():
+      self.assertEqual(dict(device_info),
+                       xilinx.get_device_info(self.platform))
+
+  def test_find_platform(self):
+    self.assertEqual(xilinx.find_platform(self.platform), self.platform)
+    self.assertEqual(
+        xilinx.find_platform(
+            os.path.join(self.tmpdir.name, 'xilinx:u250:xdma:201830.2')),
+        self.platform)
+    sdx_dir = os.path.join(self.tmpdir.name, 'sdx')
+    os.makedirs(os.path.join(sdx_dir, 'platforms'))
+    os.symlink(
+        self.platform,
+        os.path.join(sdx_dir, 'platforms', os.path.basename(self.platform)))
+    with unittest.mock.patch.dict(os.environ, {
+        'XILINX_VITIS': self.tmpdir.name,
+        'XILINX_SDX': sdx_dir,
+    }):
+      self.assertEqual(
+          xilinx.find_platform('xilinx_u250_xdma_201830_2'),
+          os.path.join(sdx_dir, 'platforms', 'xilinx_u250_xdma_201830_2'))
+      self.assertIsNone(xilinx.find_platform('nonexistent_platform'))
+
+
+class TestCmdArgs(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.TemporaryDirectory()
+    with open(os.path.join(self.tmpdir.name, 'settings64.sh'), 'w') as script:
+      script.write('export HAODA_TEST_SET=1\nunset HAODA_TEST_UNSET\n'
+                   'export PATH=/opt/xilinx/bin:$PATH\n')
+    xilinx._get_settings_env.cache_clear()
+
+  def tearDown(self):
+    xilinx._get_settings_env.cache_clear()
+    self.tmpdir.cleanup()
+
+  def test_get_cmd_args_applies_settings_to_env(self):
+    with unittest.mock.patch.dict(os.environ, {
+        'XILINX_VIVADO': self.tmpdir.name,
+        'HAODA_TEST_UNSET': '1',
+    }):
+      kwargs = {}
+      self.assertEqual(
+          xilinx.get_cmd_args(['vivado'], ['XILINX_VIVADO'], kwargs),
+          ['vivado'])
+      self.assertEqual(kwargs['env']['HAODA_TEST_SET'], '1')
+      self.assertNotIn('HAODA_TEST_UNSET', kwargs['env'])
+      self.assertEqual(kwargs['env']['PATH'],
+                       '/opt/xilinx/bin:' + os.environ['PATH'])
+      for name in '_', 'OLDPWD', 'SHLVL':
+        self.assertEqual(kwargs['env'].get(name), os.environ.get(name))
+      self.assertNotIn('PWD', kwargs['env'])
+
+      # Changes to os.environ after the capture are seen by settings64.sh.
+      os.environ['HAODA_TEST_LATER'] = '1'
+      kwargs = {}
+      cmd = xilinx.get_cmd_args(['vivado'], ['XILINX_VIVADO'], kwargs)
+      self.assertIn('settings64.sh', cmd)
+      self.assertNotIn('env', kwargs)
+      self.assertTrue(kwargs['shell'])
+
+  def test_get_cmd_args_does_not_cache_failure(self):
+    settings = os.path.join(self.tmpdir.name, 'settings64.sh')
+    with open(settings, 'w') as script:
+      script.write('false\n')
+    with unittest.mock.patch.dict(os.environ,
+                                  {'XILINX_VIVADO': self.tmpdir.name}):
+      kwargs = {}
+      with self.assertLogs(xilinx._logger, 'WARNING'):
+        xilinx.get_cmd_args(['vivado'], ['XILINX_VIVADO'], kwargs)
+      self.assertTrue(kwargs['shell'])
+      with open(settings, 'w') as script:
+        script.write('export HAODA_TEST_SET=1\n')
+      kwargs = {}
+      xilinx.get_cmd_args(['vivado'], ['XILINX_VIVADO'], kwargs)
+      self.assertEqual(kwargs['env']['HAODA_TEST_SET'], '1')
+
+  def test_get_cmd_args_keeps_caller_env(self):
+    with unittest.mock.patch.dict(os.environ,
+                                  {'XILINX_VIVADO': self.tmpdir.name}):
+      xilinx.get_cmd_args(['vivado'], ['XILINX_VIVADO'], {})
+      kwargs = {'env': {'PATH': '/custom/bin'}}
+      cmd = xilinx.get_cmd_args(['vivado'], ['XILINX_VIVADO'], kwargs)
+      # settings64.sh extends the caller's PATH when sourced in the shell.
+      self.assertEqual(kwargs['env'], {'PATH': '/custom/bin'})
+      self.assertTrue(kwargs['shell'])
+      self.assertTrue(cmd.startswith('source '))
+
+
+class TestBuildCache(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.TemporaryDirectory()
+
+  def tearDown(self):
+    self.tmpdir.cleanup()
+
+  def test_run_hls_cache_hit(self):
+    cache_dir = os.path.join(self.tmpdir.name, 'haoda', 'hls')
+    os.makedirs(cache_dir)
+    with open(os.path.join(cache_dir, 'key.tar'), 'wb') as cache:
+      cache.write(b'cached')
+    tarfileobj = io.BytesIO()
+    # No process is launched on a cache hit, so nothing needs to be on PATH.
+    env = {
+        xilinx.BUILD_CACHE_ENV: '1',
+        'XDG_CACHE_HOME': self.tmpdir.name,
+        'PATH': '',
+    }
+    with unittest.mock.patch.dict(os.environ, env), \
+        unittest.mock.patch.object(xilinx, '_get_tool_version',
+                                   return_value=b''), \
+        unittest.mock.patch.object(xilinx, '_hash_build_inputs',
+                                   return_value='key'):
+      with xilinx.RunHls(tarfileobj, ['kernel.cpp'], 'Top', '3.33',
+                         'xcu250-figd2104-2L-e') as proc:
+        self.assertTrue(proc.cache_hit)
+        self.assertEqual(proc.communicate(), (b'', b''))
+        self.assertEqual(proc.wait(), 0)
+        self.assertEqual(proc.returncode, 0)
+    self.assertEqual(tarfileobj.getvalue(), b'cached')
+
+  def test_build_cache_needs_tool_version(self):
+    env = {xilinx.BUILD_CACHE_ENV: '1', 'XDG_CACHE_HOME': self.tmpdir.name}
+    with unittest.mock.patch.dict(os.environ, env), \
+        unittest.mock.patch.object(
+            xilinx, '_get_tool_version',
+            side_effect=FileNotFoundError('vivado_hls')):
+      with self.assertLogs(xilinx._logger, 'WARNING'):
+        self.assertIsNone(
+            xilinx._get_build_cache_file('hls', 'vivado_hls',
+                                         ('XILINX_VIVADO',), '.tar', b''))
+
+
+class TestVerilogPrinter(unittest.TestCase):
+
+  def test_fifo_module_name(self):
+    for depth in 64, 2:  # BRAM and SRL FIFOs
+      out = io.StringIO()
+      printer = xilinx.VerilogPrinter(out)
+      printer.fifo_module(32, depth)
+      printer.fifo_module(32, depth, name='nm')
+      self.assertIn(f'module fifo_w32_d{depth}_A ', out.getvalue())
+      self.assertIn('module nm ', out.getvalue())
@@ -0,0 +1,23 @@
+import io
+import unittest
+
+from haoda import util
+from haoda.report.xilinx import rtl
+
+
+class TestGenerator(unittest.TestCase):
+
+  def test_rtl_hls_info(self):
+    rtl_file = io.StringIO("""`timescale 1 ns / 1 ps
+
+(* CORE_GENERATION_INFO="Dataflow_Dataflow,hls_ip_2020_2,{HLS_INPUT_TYPE=cxx,HLS_INPUT_PART=xcu280-fsvh2892-2L-e,HLS_SYN_CLOCK=2.433000}" *)
+
+module Dataflow (
+""")
+    info = rtl.RtlHlsInfo(rtl_file)
+    self.assertEqual(info['HLS_INPUT_PART'], 'xcu280-fsvh2892-2L-e')
+    self.assertEqual(info.HLS_SYN_CLOCK, '2.433000')
+    with self.assertRaises(KeyError):
+      info['HLS_SYN_LAT']
+    with self.assertRaises(util.InputError):
+      rtl.RtlHlsInfo(io.StringIO('module Dataflow ();\n'))
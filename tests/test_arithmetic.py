@@ -0,0 +1,190 @@
+import logging
+import unittest
+
+from haoda import ir
+from haoda.ir import arithmetic
+from haoda.ir.arithmetic import base
+
+
+def var(name: str) -> ir.Var:
+  return ir.Var(name=name, idx=())
+
+
+class TestArithmetic(unittest.TestCase):
+
+  def setUp(self):
+    self.a, self.b, self.c, self.d = map(var, 'abcd')
+
+  def test_flatten_singleton(self):
+    self.assertEqual(
+        base.flatten(ir.Expr(operand=(self.a,), operator=())), self.a)
+
+  def test_flatten_nested_binary_op(self):
+    expr = ir.AddSub(operand=(ir.AddSub(operand=(self.a, self.b),
+                                        operator=('+',)),
+                              ir.AddSub(operand=(self.c, self.d),
+                                        operator=('-',))),
+                     operator=('+',))
+    self.assertEqual(
+        base.flatten(expr),
+        ir.AddSub(operand=(self.a, self.b, self.c, self.d),
+                  operator=('+', '+', '-')))
+
+  def test_flatten_does_not_merge_after_minus(self):
+    inner = ir.AddSub(operand=(self.b, self.c), operator=('+',))
+    expr = ir.AddSub(operand=(self.a, inner), operator=('-',))
+    self.assertEqual(base.flatten(expr), expr)
+
+  def test_flatten_keeps_parenthesized_operations(self):
+
+    def parenthesize(expr: ir.Node) -> ir.Operand:
+      return ir.Operand(cast=None,
+                        call=None,
+                        ref=None,
+                        num=None,
+                        var=None,
+                        expr=expr)
+
+    # c * (b / d) != c * b / d for integers
+    inner = ir.MulDiv(operand=(self.b, self.d), operator=('/',))
+    expr = ir.MulDiv(operand=(self.c, parenthesize(inner)), operator=('*',))
+    self.assertEqual(base.flatten(expr),
+                     ir.MulDiv(operand=(self.c, inner), operator=('*',)))
+    self.assertEqual(str(base.flatten(expr)), '(c * (b / d))')
+    # c + (b + d) is not reassociated either, which matters for floats
+    inner = ir.AddSub(operand=(self.b, self.d), operator=('+',))
+    expr = ir.AddSub(operand=(self.c, parenthesize(inner)), operator=('+',))
+    self.assertEqual(str(base.flatten(expr)), '(c + (b + d))')
+
+  def test_flatten_left_deep_chain(self):
+    expr = self.a
+    for _ in range(32):
+      expr = ir.MulDiv(operand=(expr, self.b), operator=('*',))
+    self.assertEqual(
+        base.flatten(expr),
+        ir.MulDiv(operand=(self.a,) + (self.b,) * 32, operator=('*',) * 32))
+
+  def test_flatten_operand(self):
+    operand = ir.Operand(cast=None,
+                         call=None,
+                         ref=None,
+                         num=None,
+                         var=self.a,
+                         expr=None)
+    self.assertEqual(base.flatten(operand), self.a)
+
+  def test_flatten_unary(self):
+    self.assertEqual(
+        base.flatten(ir.Unary(operator=('-', '-'), operand=self.a)), self.a)
+    self.assertEqual(
+        base.flatten(ir.Unary(operator=('!', '!'), operand=self.a)), self.a)
+    unary = ir.Unary(operator=('-', '!'), operand=self.a)
+    self.assertEqual(base.flatten(unary), unary)
+
+  def test_flatten_reduction_call(self):
+    expr = ir.Call(name='max',
+                   arg=(ir.Call(name='max', arg=(self.a, self.b)),
+                        ir.Call(name='min', arg=(self.c, self.d))))
+    self.assertEqual(
+        base.flatten(expr),
+        ir.Call(name='max',
+                arg=(self.a, self.b, ir.Call(name='min',
+                                             arg=(self.c, self.d)))))
+
+  def test_flatten_sees_updated_types(self):
+    expr = ir.AddSub(operand=(self.a, self.b), operator=('+',))
+    self.assertIsNone(base.flatten(expr).haoda_type)
+    self.a.haoda_type = 'int16'
+    self.assertEqual(base.flatten(expr).haoda_type, 'int16')
+
+  def test_simplify_iterable(self):
+    exprs = [
+        ir.Expr(operand=(self.a,), operator=()),
+        ir.Expr(operand=(self.b,), operator=()),
+    ]
+    self.assertEqual(arithmetic.simplify(exprs), [self.a, self.b])
+    self.assertIsNone(arithmetic.simplify(None))
+    self.assertEqual(arithmetic.simplify('ab'), 'ab')
+
+  def test_reverse_distribute(self):
+    expr = ir.AddSub(operand=(ir.MulDiv(operand=(self.a, self.b),
+                                        operator=('*',)),
+                              ir.MulDiv(operand=(self.a, self.c),
+                                        operator=('*',))),
+                     operator=('+',))
+    self.assertEqual(
+        base.reverse_distribute(expr),
+        ir.MulDiv(operand=(self.a,
+                           ir.AddSub(operand=(self.b, self.c),
+                                     operator=('+',))),
+                  operator=('*',)))
+
+  def test_reverse_distribute_subtracted_first(self):
+    expr = ir.AddSub(operand=(ir.MulDiv(operand=(self.a, self.b),
+                                        operator=('*',)), self.c),
+                     operator=('-',))
+    self.assertEqual(base.reverse_distribute(expr), expr)
+
+  def test_simplify_flatten_and_distribute(self):
+    expr = ir.AddSub(operand=(ir.MulDiv(operand=(self.a, self.b),
+                                        operator=('*',)),
+                              ir.Expr(operand=(ir.MulDiv(operand=(self.a,
+                                                                  self.c),
+                                                         operator=('*',)),),
+                                      operator=())),
+                     operator=('+',))
+    self.assertEqual(
+        arithmetic.simplify(expr, passes=('flatten', 'distribute')),
+        ir.MulDiv(operand=(self.a,
+                           ir.AddSub(operand=(self.b, self.c),
+                                     operator=('+',))),
+                  operator=('*',)))
+    inner = ir.AddSub(operand=(self.b, self.c), operator=('+',))
+    expr = ir.AddSub(operand=(self.a,
+                              ir.Operand(cast=None,
+                                         call=None,
+                                         ref=None,
+                                         num=None,
+                                         var=None,
+                                         expr=inner)),
+                     operator=('+',))
+    self.assertEqual(
+        str(arithmetic.simplify(expr, passes=('flatten', 'distribute'))),
+        '(a + (b + c))')
+    with self.assertRaises(ValueError):
+      arithmetic.simplify(expr, passes=('unknown',))
+
+  def test_reverse_distribute_without_product(self):
+    expr = ir.AddSub(operand=(self.a, self.b, self.c), operator=('+', '-'))
+    self.assertIs(base.reverse_distribute(expr), expr)
+
+  def test_print_tree(self):
+    expr = ir.AddSub(operand=(self.a, self.b), operator=('+',))
+    lines = []
+    self.assertEqual(base.print_tree(expr, lines.append), expr)
+    self.assertEqual(lines, [
+        'root',
+        ' +-AddSub(None): (a + b)',
+        '  +-Var(None): a',
+        '  +-Var(None): b',
+    ])
+
+  def test_print_tree_disabled_logger(self):
+    logger = logging.getLogger(__name__)
+    logger.setLevel(logging.INFO)
+    expr = ir.AddSub(operand=(self.a, self.b), operator=('+',))
+    # The tree is not visited, so the very same node is returned.
+    self.assertIs(base.print_tree(expr, logger.debug), expr)
+
+  def test_propagate_type(self):
+    int8 = ir.Type('int8')
+    expr = base.propagate_type(
+        ir.AddSub(operand=(self.a, self.b), operator=('+',)), {
+            'a': int8,
+            'b': int8
+        })
+    self.assertEqual([x.haoda_type for x in expr.operand], [int8, int8])
+
+
+if __name__ == '__main__':
+  unittest.main()
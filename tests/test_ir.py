@@ -1,6 +1,9 @@
+import copy
+import pickle
 import unittest
 
 from haoda import ir
+from haoda import util
 
 
 class TestIr(unittest.TestCase):
@@ -64,3 +67,233 @@ class TestIr(unittest.TestCase):
     self.assertEqual(str(ir.Var(name='foo', idx=[])), 'foo')
     self.assertEqual(str(ir.Var(name='foo', idx=[0])), 'foo[0]')
     self.assertEqual(str(ir.Var(name='foo', idx=[0, 1])), 'foo[0][1]')
+
+  def test_hash(self):
+    let = ir.Let(haoda_type=self.int8, name='foo_l', expr=self.let_expr)
+    self.assertEqual(hash(let), hash(self.let))
+    self.assertEqual(len({let, self.let, self.let2}), 2)
+    let.haoda_type = 'int16'
+    self.assertNotEqual(hash(let), hash(self.let))
+
+  def test_visit_deep_tree(self):
+    expr = self.let_ref
+    for _ in range(10000):
+      expr = ir.Unary(operator=('-',), operand=expr)
+    visited = []
+    expr = expr.visit(None,
+                      post_recursion=lambda node, args: visited.append(node))
+    self.assertEqual(len(visited), 10001)
+    self.assertEqual(visited[0], self.let_ref)
+    self.assertIs(visited[-1], expr)
+
+  def test_module_traversal(self):
+    modules = [ir.Module(name=name) for name in 'abcde']
+    for src, dst in ('ab', 'ac', 'bd', 'cd', 'ce', 'de'):
+      src_module = modules['abcde'.index(src)]
+      dst_module = modules['abcde'.index(dst)]
+      src_module.children.append(dst_module)
+      dst_module.parents.append(src_module)
+    self.assertEqual([_.name for _ in modules[0].tpo_node_gen()],
+                     list('abcde'))
+    self.assertEqual(modules[0].get_descendants(), set(modules))
+    self.assertEqual(
+        {(src.name, dst.name) for src, dst in modules[0].get_connections()},
+        {tuple(edge) for edge in ('ab', 'ac', 'bd', 'cd', 'ce', 'de')})
+
+  def test_module_interfaces(self):
+    def dram_ref(var, dram):
+      return ir.DRAMRef(haoda_type=self.int8, dram=dram, var=var, offset=0)
+
+    module = ir.Module(name='m')
+    upstream = ir.Module(name='up')
+    fifo_in = ir.FIFO(upstream, module, depth=2)
+    fifo_out = ir.FIFO(module, upstream, depth=2)
+    module.lets = [
+        ir.Let(haoda_type=self.int8,
+               name=dram_ref('c', (0, 1)),
+               expr=ir.AddSub(operand=(dram_ref('a', (0,)), fifo_in),
+                              operator=('+',)))
+    ]
+    module.exprs = {
+        fifo_out: ir.AddSub(operand=(dram_ref('b', (1,)), fifo_in),
+                            operator=('+',))
+    }
+    self.assertEqual([(_.var, bank) for _, bank in module.dram_reads],
+                     [('a', 0), ('b', 1)])
+    self.assertEqual([(_.var, bank) for _, bank in module.dram_writes],
+                     [('c', 0), ('c', 1)])
+    self.assertEqual(module.input_fifos, ('from_up_to_m',))
+    self.assertEqual(module.output_fifos, ('from_m_to_up',))
+    self.assertIs(module.fifo(upstream), fifo_out)
+    with self.assertRaises(KeyError):
+      module.fifo(module)
+
+    # A module has at most one FIFO to each destination.
+    fanout = ir.Module(name='f')
+    fanout.exprs = {
+        ir.FIFO(fanout, upstream, depth=2): fifo_in,
+        ir.FIFO(fanout, upstream, depth=4): fifo_in,
+    }
+    self.assertEqual(len(fanout.exprs), 1)
+    self.assertIs(fanout.fifo(upstream), fanout.fifo_dict[(fanout, upstream)])
+
+    # Interfaces of the visited module must reflect the visited expressions.
+    def replace_reads(node, args):
+      if isinstance(node, ir.DRAMRef) and node.var in 'ab':
+        return dram_ref('d', (2,))
+      return None
+
+    visited = module.visit_loads(replace_reads)
+    self.assertEqual([(_.var, bank) for _, bank in visited.dram_reads],
+                     [('d', 2)])
+    self.assertIs(visited.children, module.children)
+
+    # Modules with the same trait share the interfaces of the trait.
+    other = ir.Module(name='o')
+    upstream.exprs = {
+        fifo_in: dram_ref('u', (0,)),
+        ir.FIFO(upstream, other, depth=2): dram_ref('u', (0,)),
+    }
+    other.lets = [
+        ir.Let(haoda_type=self.int8,
+               name=dram_ref('c', (0, 1)),
+               expr=ir.AddSub(operand=(dram_ref('a', (0,)),
+                                       ir.FIFO(upstream, other, depth=2)),
+                              operator=('+',)))
+    ]
+    other.exprs = {
+        ir.FIFO(other, upstream, depth=2):
+            ir.AddSub(operand=(dram_ref('b', (1,)),
+                               ir.FIFO(upstream, other, depth=2)),
+                      operator=('+',))
+    }
+    trait, other_trait = ir.ModuleTrait(module), ir.ModuleTrait(other)
+    self.assertEqual(trait, other_trait)
+    self.assertEqual(trait.input_fifos, ('fifo_ld_0',))
+    self.assertEqual(trait.output_fifos, ('fifo_st_0',))
+    self.assertIs(other_trait.dram_reads, trait.dram_reads)
+
+  def test_hash_follows_retyped_child(self):
+    def operand():
+      return ir.Operand(cast=ir.Cast(haoda_type='int32', expr=self.let_expr),
+                        call=None, ref=None, num=None, var=None, expr=None)
+
+    op = operand()
+    hash(op)
+    op.cast.haoda_type = 'int8'
+    fresh = operand()
+    fresh.cast.haoda_type = 'int8'
+    self.assertEqual(op, fresh)
+    self.assertEqual(hash(op), hash(fresh))
+    self.assertIn(fresh, {op})
+
+  def test_copy_does_not_inherit_hash(self):
+    hash(self.let_expr)
+    expr = self.let_expr.visit(
+        lambda node, args: self.let_ref2 if node == self.let_ref else None)
+    self.assertEqual(hash(expr), hash(self.let_expr2))
+
+  def test_haoda_type_cache(self):
+    expr = ir.AddSub(operand=(self.let_ref,), operator=())
+    self.assertIsNone(expr.haoda_type)
+    self.let_ref.haoda_type = self.int8
+    self.assertEqual(expr.haoda_type, self.int8)
+    int16 = ir.Type('int16')
+    self.let_ref2.haoda_type = int16
+    expr2 = expr.visit(
+        lambda node, args: self.let_ref2 if node == self.let_ref else None)
+    self.assertEqual(expr2.haoda_type, int16)
+    self.assertEqual(expr.haoda_type, self.int8)
+
+  def test_haoda_type_follows_retyped_operands(self):
+    expr = ir.AddSub(operand=(self.let_ref, self.let_ref2), operator=('+',))
+    self.let_ref.haoda_type = self.let_ref2.haoda_type = self.int8
+    self.assertEqual(expr.haoda_type, self.int8)
+    self.let_ref.haoda_type = self.let_ref2.haoda_type = 'int32'
+    self.assertEqual(expr.haoda_type, 'int32')
+
+  def test_expr_after_visit(self):
+    var = ir.Var(name='foo', idx=[0])
+    var2 = ir.Var(name='bar', idx=[])
+    expr = ir.AddSub(operand=(var, var2), operator=('+',))
+    self.assertEqual(expr.c_expr, '(foo[0] + bar)')
+    expr2 = expr.visit(lambda node, args: var if node == var2 else None)
+    self.assertEqual(expr2.c_expr, '(foo[0] + foo[0])')
+
+  def test_expr_follows_retyped_args(self):
+    args = [ir.Var(name=name, idx=[]) for name in 'ab']
+    for arg in args:
+      arg.haoda_type = self.int8
+    expr = ir.Call(name='max', arg=args)
+    self.assertEqual(expr.cl_expr, 'max(a, b)')
+    for arg in args:
+      arg.haoda_type = 'float32'
+    self.assertEqual(expr.cl_expr, 'fmax(a, b)')
+
+  def test_variadic_call_expr(self):
+    args = [ir.Var(name=name, idx=[]) for name in 'abc']
+    for arg, haoda_type in zip(args, ('int8', 'float32', 'int8')):
+      arg.haoda_type = haoda_type
+    expr = ir.Call(name='max', arg=args)
+    self.assertEqual(expr.c_expr, 'std::max(a, std::max(b, c))')
+    self.assertEqual(expr.cl_expr, 'max(a, fmax(b, c))')
+
+  def test_type_is_shared(self):
+    self.assertIs(ir.Type('int8'), self.int8)
+    self.assertIs(copy.copy(self.int8), self.int8)
+    self.assertIs(pickle.loads(pickle.dumps(self.int8)), self.int8)
+    self.assertEqual(ir.Type('float'), ir.Type('float32'))
+    with self.assertRaises(TypeError):
+      ir.Type(8)
+
+  def test_type_width(self):
+    for val, width in [('uint8', 8), ('int16', 16), ('int32_16', 32),
+                       ('uint9_3', 9), ('float16', 16), ('half', 16),
+                       ('double', 64)]:
+      self.assertEqual(ir.Type(val).width_in_bits, width)
+    with self.assertRaises(util.InternalError):
+      ir.Type('uint').width_in_bits
+
+  def test_type_is_fixed(self):
+    for val in ('uint8_4', 'int32_16'):
+      self.assertTrue(ir.Type(val).is_fixed)
+    for val in ('uint8', 'int32', 'float32', None):
+      self.assertFalse(ir.Type(val).is_fixed)
+
+  def test_unparenthesize(self):
+    for expr, expected in [('a', 'a'), ('(a)', 'a'), ('((a + b))', 'a + b'),
+                           ('(a) + (b)', '(a) + (b)'),
+                           ('((a) + (b))', '(a) + (b)'), ('(a))', '(a))')]:
+      self.assertEqual(ir.unparenthesize(expr), expected)
+
+  def test_to_reduction(self):
+    operands = (self.ref, self.expr_ref, self.let_ref)
+    self.assertEqual(
+        ir.to_reduction(ir.AddSub(operand=operands, operator=('+', '+'))),
+        ('+', operands))
+    self.assertIsNone(
+        ir.to_reduction(ir.AddSub(operand=operands, operator=('+', '-'))))
+    self.assertIsNone(ir.to_reduction(ir.AddSub(operand=operands[:1],
+                                                 operator=())))
+    self.assertEqual(ir.to_reduction(ir.Call(name='max', arg=operands)),
+                     ('max', operands))
+
+  def test_str2int(self):
+    for literal, val in [('0', 0), ('42', 42), ('42ull', 42), ('0x2aU', 42),
+                         ('0B101010', 42), ('052', 42), ('0o52', 42),
+                         ('-052', -42), ('-0x2a', -42), ('+42L', 42)]:
+      self.assertEqual(ir.str2int(literal), val)
+    self.assertEqual(ir.str2int(None, 42), 42)
+    with self.assertRaises(ValueError):
+      ir.str2int('08')
+
+  def test_pack_identifier(self):
+    exprs = (ir.Var(name='a', idx=()), ir.Var(name='b', idx=[0]))
+    pack = ir.Pack(exprs=exprs)
+    self.assertIs(pack.identifier, pack.identifier)
+    self.assertEqual(pack.identifier, ir.Pack(exprs=exprs).identifier)
+    other = pack.visit(lambda node, args: exprs[0]
+                       if node == exprs[1] else None)
+    self.assertNotEqual(other.identifier, pack.identifier)
+    self.assertEqual(ir.Unpack(expr=pack, idx=1).identifier,
+                     f'{pack.identifier}_val_1')
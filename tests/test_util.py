@@ -1,3 +1,4 @@
+import io
 import unittest
 
 from haoda import util
@@ -39,6 +40,20 @@ class TestUtil(unittest.TestCase):
     self.assertEqual(util.get_suitable_int_type(15, -17), 'int6')
     self.assertEqual(util.get_suitable_int_type(16, -16), 'int6')
 
+  def test_print_func(self):
+    out = io.StringIO()
+    printer = util.CppPrinter(out)
+    printer.print_func('foo', ['a', 'b'], suffix=';')
+    printer.print_func('bar', [], suffix=';')
+    printer.print_func('baz', ['a' * 10, 'b' * 10, 'c' * 10], align=28)
+    self.assertEqual(
+        out.getvalue(),
+        'foo(a, b);\n'
+        'bar();\n'
+        'baz(aaaaaaaaaa, bbbbbbbbbb, \n'
+        '  cccccccccc)\n',
+    )
+
 
 if __name__ == '__main__':
   unittest.main()